@@ -23,9 +23,10 @@ def read_player_csv(file_path):
 
 
 # Fetch the advanced stats for players from the vlr.gg stats page
-def fetch_game_advanced_stats():
+# timespan is one of vlr.gg's windows: 30d, 60d, 90d or all; rolling windows over game data come from the stat cube
+def fetch_game_advanced_stats(timespan='90d'):
     try:
-        url = "https://www.vlr.gg/stats/?event_group_id=all&event_id=all&region=all&min_rounds=0&min_rating=1550&agent=all&map_id=all&timespan=90d"
+        url = f"https://www.vlr.gg/stats/?event_group_id=all&event_id=all&region=all&min_rounds=0&min_rating=1550&agent=all&map_id=all&timespan={timespan}"
         response = requests.get(url)
         response.raise_for_status()
 
@@ -0,0 +1,39 @@
+import json
+import sys
+
+# Split preprocessed_players.json into a compact hot table for the team search and a cold store with the heavy
+# fields, which are only read for the five players of the final team.
+# Writes preprocessed_players.hot.json and preprocessed_players.cold.jsonl next to the input file;
+# lambda/package_lambda.py adds both to the Lambda package when they are in lambda/.
+
+# Fields the search never reads; past_teams keeps only team names in the hot table
+cold_fields = ['recent_match_result', 'latest_news', 'agent_specialization', 'past_teams', 'previous_regions']
+
+
+def split_player_data(input_file='preprocessed_players.json'):
+    base_path = input_file[:-len('.json')] if input_file.endswith('.json') else input_file
+    with open(input_file, 'r', encoding='utf-8') as f:
+        players = json.load(f)
+
+    hot_players = []
+    offset = 0
+    # One JSON line per player; each hot record keeps the byte offset and length of its line
+    with open(base_path + '.cold.jsonl', 'wb') as cold_file:
+        for player in players:
+            cold = {field: player[field] for field in cold_fields if field in player}
+            line = (json.dumps(cold, ensure_ascii=False) + '\n').encode('utf-8')
+            cold_file.write(line)
+            hot = {field: value for field, value in player.items() if field not in cold_fields}
+            hot['past_teams'] = [{'team_name': team['team_name']} for team in player.get('past_teams', [])]
+            hot['cold_offset'] = offset
+            hot['cold_length'] = len(line)
+            hot_players.append(hot)
+            offset += len(line)
+
+    with open(base_path + '.hot.json', 'w', encoding='utf-8') as f:
+        json.dump(hot_players, f, ensure_ascii=False)
+    print(f'Split {len(players)} players into {base_path}.hot.json and {base_path}.cold.jsonl')
+
+
+if __name__ == '__main__':
+    split_player_data(sys.argv[1] if len(sys.argv) > 1 else 'preprocessed_players.json')
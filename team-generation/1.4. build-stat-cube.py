@@ -0,0 +1,167 @@
+import json
+import os
+import re
+import sys
+
+import esports_data
+
+# Build the per-player stat cube from the game files written by download_gamedata.py under
+# <league>/games/<year>/<platformGameId>.json. Each cell sums one player's measures on one map, with one agent, on
+# one day (UTC), so the Lambda function can aggregate any map, agent or date slice without reading the games.
+# Writes lambda/stat_cube.json; lambda/package_lambda.py adds it to the Lambda package.
+# Usage: python "1.4. build-stat-cube.py" [data root, default ..] [output file]
+
+# Summed per cell; every derived stat is a ratio of these
+measures = ['games', 'rounds', 'kills', 'deaths', 'assists', 'damage', 'first_kills', 'first_deaths']
+
+# Game files name maps by their internal code names
+map_codenames = {
+    'ascent': 'ascent', 'duality': 'bind', 'triad': 'haven', 'bonsai': 'split', 'port': 'icebox',
+    'foxtrot': 'breeze', 'canyon': 'fracture', 'pitt': 'pearl', 'jam': 'lotus', 'juliett': 'sunset',
+    'infinity': 'abyss', 'range': 'range'
+}
+
+# Agent GUIDs, for game files whose agent display names are empty
+agent_guids = {
+    'add6443a-41bd-e414-f6ad-e58d267f4e95': 'jett', 'f94c3b30-42be-e959-889c-5aa313dba261': 'raze',
+    'a3bfb853-43b2-7238-a4f1-ad90e9e46bcc': 'reyna', 'eb93336a-449b-9c1b-0a54-a891f7921d69': 'phoenix',
+    '7f94d92c-4234-0a36-9646-3a87eb8b5c89': 'yoru', 'bb2a4828-46eb-8cd1-e765-15848195d751': 'neon',
+    '0e38b510-41a8-5780-5e8f-568b2a4f2d6c': 'iso', '1dbf2edd-4729-0984-3115-daa5eed44993': 'clove',
+    '569fdd95-4d10-43ab-ca70-79becc718b46': 'sage', '1e58de9c-4950-5125-93e9-a0aee9f98746': 'killjoy',
+    '117ed9e3-49f3-6512-3ccf-0cada7e3823b': 'cypher', '22697a3d-45bf-8dd7-4fec-84a9e28c69d7': 'chamber',
+    'cc8b64c8-4b25-4ff9-6e7f-37b4da43d235': 'deadlock', 'efba5359-4016-a1e5-7626-b1ae76895940': 'vyse',
+    '707eab51-4836-f488-046a-cda6bf494859': 'viper', '9f0d8ba9-4140-b941-57d3-a7ad57c6b417': 'brimstone',
+    '8e253930-4c05-31dd-1b6c-968525494517': 'omen', '41fb69c1-4189-7b37-f117-bcaf1e96f1bf': 'astra',
+    '95b78ed7-4637-86d9-7e41-71ba8c293152': 'harbor', '320b2a48-4d9b-a075-30f1-1f93a9b638fa': 'sova',
+    '5f8d3a7f-467b-97f3-062c-13acf203c006': 'breach', '6f2a04ca-43e0-be17-7f36-b3908627744d': 'skye',
+    '601dbbe7-43ce-be57-2a40-4abd24953621': 'kayo', 'dade69b4-4f5a-8528-247b-219e5a1facd6': 'fade',
+    'e370fa57-4757-3604-3648-499e1f642d3f': 'gekko'
+}
+
+
+def asset_name(asset, names=None):
+    # Map and agent assets carry a display name, a game path such as /Game/Maps/Ascent/Ascent, or only a GUID
+    fallback = (asset or {}).get('fallback', {})
+    name = (fallback.get('displayName') or '').strip()
+    if not name:
+        return (names or {}).get((fallback.get('guid') or '').lower())
+    name = name.rstrip('/').split('/')[-1].lower()
+    return re.sub(r'[^a-z0-9]', '', name)
+
+
+def parse_game(events, participants):
+    # One game's map, day and per-player agent and measures, keyed by esports player id. participants is the
+    # mapping_data participantMapping from in-game player numbers to esports player ids.
+    game = {'map': None, 'day': None, 'players': {}}
+    agents = {}
+    rounds = 0
+    first_blood = False
+    for event in events:
+        if game['day'] is None and event.get('metadata', {}).get('wallTime'):
+            game['day'] = event['metadata']['wallTime'][:10]
+        if 'configuration' in event:
+            configuration = event['configuration']
+            map_name = asset_name(configuration.get('selectedMap'))
+            game['map'] = map_codenames.get(map_name, map_name)
+            for player in configuration.get('players', []):
+                agent = asset_name(player.get('selectedAgent'), agent_guids)
+                if agent:
+                    agents[str(player['playerId']['value'])] = agent
+        elif 'roundStarted' in event:
+            rounds += 1
+            first_blood = False
+        elif 'playerDied' in event:
+            died = event['playerDied']
+            killer = str(died.get('killerId', {}).get('value'))
+            deceased = str(died.get('deceasedId', {}).get('value'))
+            credited = [(deceased, 'deaths')] + ([(killer, 'kills')] if killer != deceased else [])
+            for number, measure in credited:
+                if number in participants:
+                    stats = game['players'].setdefault(number, dict.fromkeys(measures, 0))
+                    stats[measure] += 1
+                    if not first_blood:
+                        stats['first_' + measure] += 1
+            first_blood = True
+            for assistant in died.get('assistants', []):
+                number = str(assistant.get('assistantId', {}).get('value'))
+                if number in participants:
+                    game['players'].setdefault(number, dict.fromkeys(measures, 0))['assists'] += 1
+        elif 'damageEvent' in event:
+            damage = event['damageEvent']
+            causer = str(damage.get('causerId', {}).get('value'))
+            victim = str(damage.get('victimId', {}).get('value'))
+            if causer in participants and causer != victim:
+                stats = game['players'].setdefault(causer, dict.fromkeys(measures, 0))
+                stats['damage'] += damage.get('damageAmount', 0)
+    players = {}
+    for number, player_id in participants.items():
+        stats = game['players'].get(number, dict.fromkeys(measures, 0))
+        stats.update(games=1, rounds=rounds)
+        players[player_id] = {'agent': agents.get(number), 'stats': stats}
+    game['players'] = players
+    return game
+
+
+def new_stat_cube():
+    return {'measures': measures, 'maps': [], 'agents': [], 'days': [], 'games': [], 'players': {}}
+
+
+def dimension_index(cube, dimension, value):
+    values = cube[dimension]
+    if value not in values:
+        values.append(value)
+    return values.index(value)
+
+
+def add_game(cube, platform_game_id, game, known_games=None):
+    # Adds a parsed game once; returns False when the cube already has it. known_games is an optional set of the
+    # cube's game ids, kept current, for callers adding many games.
+    if known_games is None:
+        known_games = set(cube['games'])
+    if platform_game_id in known_games or not game['map'] or not game['day']:
+        return False
+    cube['games'].append(platform_game_id)
+    known_games.add(platform_game_id)
+    map_index = dimension_index(cube, 'maps', game['map'])
+    day_index = dimension_index(cube, 'days', game['day'])
+    for player_id, player in game['players'].items():
+        agent_index = dimension_index(cube, 'agents', player['agent'] or 'unknown')
+        cells = cube['players'].setdefault(player_id, [])
+        values = [player['stats'][measure] for measure in measures]
+        for cell in cells:
+            if cell[:3] == [map_index, agent_index, day_index]:
+                cell[3:] = [total + value for total, value in zip(cell[3:], values)]
+                break
+        else:
+            cells.append([map_index, agent_index, day_index] + values)
+    return True
+
+
+def build_stat_cube(root='..', cube=None):
+    # Adds every downloaded game not yet in the cube, so rerunning after new downloads only parses the new games
+    cube = cube or new_stat_cube()
+    known_games = set(cube['games'])
+    added = 0
+    for league in esports_data.leagues:
+        for mapping in esports_data.read_esports_data(root, league, 'mapping_data.json'):
+            if mapping['platformGameId'] in known_games:
+                continue
+            path = esports_data.find_game_file(root, league, mapping['platformGameId'])
+            if path is not None:
+                with open(path, 'r', encoding='utf-8') as f:
+                    game = parse_game(json.load(f), mapping['participantMapping'])
+                added += add_game(cube, mapping['platformGameId'], game, known_games)
+    return cube, added
+
+
+if __name__ == '__main__':
+    root = sys.argv[1] if len(sys.argv) > 1 else '..'
+    output_file = sys.argv[2] if len(sys.argv) > 2 else os.path.join('lambda', 'stat_cube.json')
+    cube = None
+    if os.path.isfile(output_file):
+        with open(output_file, 'r', encoding='utf-8') as f:
+            cube = json.load(f)
+    cube, added = build_stat_cube(root, cube)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(cube, f, separators=(',', ':'))
+    print(f"Added {added} games; {len(cube['games'])} games, {len(cube['players'])} players in {output_file}")
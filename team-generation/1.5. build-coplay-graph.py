@@ -0,0 +1,96 @@
+import json
+import os
+import sys
+
+import esports_data
+
+# Build the co-play graph from the esports mapping data of all three leagues: for every pair of players, the games
+# they played on the same team, recency-weighted, stored as a symmetric CSR matrix (row pointers, column indices and
+# per-edge values) so the Lambda function can look up any pair with one bisection.
+# Writes lambda/coplay_graph.json; lambda/package_lambda.py adds it to the Lambda package.
+# Usage: python "1.5. build-coplay-graph.py" [data root, default ..] [output file]
+
+# Games count half as much for every year they are older than the graph's latest year
+base_year = 2020
+half_life_years = 1
+
+
+def new_coplay_graph():
+    return {'base_year': base_year, 'half_life_years': half_life_years, 'year': None, 'games': [], 'players': [],
+            'indptr': [0], 'indices': [], 'games_together': [], 'recent': [], 'last_year': []}
+
+
+def graph_edges(graph):
+    # The CSR matrix as {(row player, column player): [games, recent, last year]}
+    edges = {}
+    players = graph['players']
+    for row, player_id in enumerate(players):
+        for position in range(graph['indptr'][row], graph['indptr'][row + 1]):
+            edges[(player_id, players[graph['indices'][position]])] = [
+                graph['games_together'][position], graph['recent'][position], graph['last_year'][position]]
+    return edges
+
+
+def store_edges(graph, edges):
+    # Rows sorted by player id and columns sorted within each row, so pair lookups can bisect
+    players = sorted({player_id for edge in edges for player_id in edge})
+    columns = {player_id: column for column, player_id in enumerate(players)}
+    rows = [[] for _ in players]
+    for (player_id, other_id), values in edges.items():
+        rows[columns[player_id]].append((columns[other_id], values))
+    graph.update(players=players, indptr=[0], indices=[], games_together=[], recent=[], last_year=[])
+    for row in rows:
+        row.sort()
+        for column, (games, recent, last_year) in row:
+            graph['indices'].append(column)
+            graph['games_together'].append(games)
+            graph['recent'].append(recent)
+            graph['last_year'].append(last_year)
+        graph['indptr'].append(len(graph['indices']))
+
+
+def build_coplay_graph(root='..', graph=None):
+    # One pass over the games of every league, reading each league's mapping data file whole; games already in the
+    # graph are skipped, so rerunning after new games only adds theirs to the existing edges
+    graph = graph or new_coplay_graph()
+    known_games = set(graph['games'])
+    tournaments = []
+    for league in esports_data.leagues:
+        tournaments += esports_data.read_esports_data(root, league, 'tournaments.json')
+    years = esports_data.tournament_years(tournaments)
+    edges = graph_edges(graph)
+    added = 0
+    for league in esports_data.leagues:
+        for mapping in esports_data.read_esports_data(root, league, 'mapping_data.json'):
+            if mapping['platformGameId'] in known_games:
+                continue
+            known_games.add(mapping['platformGameId'])
+            graph['games'].append(mapping['platformGameId'])
+            year = years.get(mapping['tournamentId']) or graph['year'] or base_year
+            graph['year'] = max(graph['year'] or year, year)
+            weight = 2 ** ((year - base_year) / half_life_years)  # Decayed to the graph's year when read
+            for team in esports_data.game_sides(mapping):
+                for player_id in team:
+                    for other_id in team:
+                        if player_id != other_id:
+                            edge = edges.setdefault((player_id, other_id), [0, 0, year])
+                            edge[0] += 1
+                            edge[1] += weight
+                            edge[2] = max(edge[2], year)
+            added += 1
+    store_edges(graph, edges)
+    return graph, added
+
+
+if __name__ == '__main__':
+    root = sys.argv[1] if len(sys.argv) > 1 else '..'
+    output_file = sys.argv[2] if len(sys.argv) > 2 else os.path.join('lambda', 'coplay_graph.json')
+    graph = None
+    if os.path.isfile(output_file):
+        with open(output_file, 'r', encoding='utf-8') as f:
+            graph = json.load(f)
+    graph, added = build_coplay_graph(root, graph)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(graph, f, separators=(',', ':'))
+    print(f"Added {added} games; {len(graph['players'])} players and {len(graph['indices']) // 2} pairs "
+          f"in {output_file}")
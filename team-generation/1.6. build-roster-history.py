@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+
+import esports_data
+
+# Build the roster history from the esports data of all three leagues in one pass: for every team, the time-ordered
+# stints of its players (from the games in mapping_data.json), and every player's current team (players.json).
+# Teams are identified by their official ids from teams.json, so past-teammate checks compare ids instead of scraped
+# team names.
+# Writes lambda/roster_history.json; lambda/package_lambda.py adds it to the Lambda package.
+# Usage: python "1.6. build-roster-history.py" [data root, default ..] [output file]
+
+# A player missing from more than this many consecutive games of a team starts a new stint when they return
+stint_gap_games = 10
+
+
+def team_stints(games):
+    # Stints of one team's players from its games sorted by time: [player id, first game, last game, first year,
+    # last year, games], game positions counted within the team
+    stints = []
+    open_stints = {}
+    for position, (_, year, player_ids) in enumerate(games):
+        for player_id in player_ids:
+            stint = open_stints.get(player_id)
+            if stint is None or position - stint[2] > stint_gap_games + 1:
+                stint = [player_id, position, position, year, year, 0]
+                open_stints[player_id] = stint
+                stints.append(stint)
+            stint[2] = position
+            stint[4] = year or stint[4]
+            stint[3] = stint[3] or year
+            stint[5] += 1
+    return sorted(stints, key=lambda stint: (stint[1], stint[0]))
+
+
+def build_roster_history(root='..'):
+    team_names = {}
+    home_teams = {}
+    tournaments = []
+    for league in esports_data.leagues:
+        team_names.update((team['id'], team['name'])
+                          for team in esports_data.read_esports_data(root, league, 'teams.json'))
+        home_teams.update((player['id'], player.get('home_team_id'))
+                          for player in esports_data.read_esports_data(root, league, 'players.json'))
+        tournaments += esports_data.read_esports_data(root, league, 'tournaments.json')
+    years = esports_data.tournament_years(tournaments)
+    # One pass over the games of every league; esports game ids grow with time and order each team's games
+    team_games = {}
+    seen_games = set()
+    for league in esports_data.leagues:
+        for mapping in esports_data.read_esports_data(root, league, 'mapping_data.json'):
+            if mapping['platformGameId'] in seen_games:
+                continue
+            seen_games.add(mapping['platformGameId'])
+            for team_id, player_ids in esports_data.game_rosters(mapping, home_teams).items():
+                team_games.setdefault(team_id, []).append(
+                    (int(mapping['esportsGameId']), years.get(mapping['tournamentId']), player_ids))
+    teams = {}
+    for team_id, games in team_games.items():
+        games.sort(key=lambda game: game[0])
+        teams[team_id] = {'name': team_names.get(team_id), 'games': len(games), 'stints': team_stints(games)}
+    for team_id in set(home_teams.values()) - set(teams) - {None}:
+        teams[team_id] = {'name': team_names.get(team_id), 'games': 0, 'stints': []}  # Current teams without games
+    return {'teams': teams, 'home_teams': {player_id: team_id for player_id, team_id in home_teams.items()
+                                           if team_id}}
+
+
+if __name__ == '__main__':
+    root = sys.argv[1] if len(sys.argv) > 1 else '..'
+    output_file = sys.argv[2] if len(sys.argv) > 2 else os.path.join('lambda', 'roster_history.json')
+    history = build_roster_history(root)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, separators=(',', ':'))
+    stints = sum(len(team['stints']) for team in history['teams'].values())
+    print(f"{len(history['teams'])} teams, {stints} stints and {len(history['home_teams'])} current players "
+          f"in {output_file}")
@@ -0,0 +1,239 @@
+import bisect
+import datetime
+import json
+import os
+import re
+import sys
+import time
+
+import esports_data
+
+# Elo ratings of teams and players, from match results processed in chronological order: the vlr.gg results in the
+# players' recent_match_result (collected by 1.1.get_match_result.py) and, where downloaded, the game files of the
+# mapping_data games. A player's rating moves with their team's results, weighted by the strength of the opponent.
+# Every rating keeps its history, so ratings can be read at any date. Rerunning with an existing ratings file only
+# processes the new matches, each in O(players in the match), unless one is older than the ratings' last match, in
+# which case every match is processed again in order.
+# Writes lambda/ratings.json; lambda/package_lambda.py adds it to the Lambda package.
+# Usage: python "1.7. build-ratings.py" [player data, default lambda/preprocessed_players.json] [data root, default ..]
+#        [output file]
+
+initial_rating = 1500
+k_factor = 24
+# Ratings move faster until they have this many games behind them
+provisional_games = 10
+provisional_k_factor = 48
+
+
+def expected_score(rating, opponent_rating):
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def new_ratings():
+    return {'initial_rating': initial_rating, 'teams': {}, 'players': {}, 'matches': [], 'last_date': None}
+
+
+def update_rating(entry, expected, score, date):
+    k = provisional_k_factor if entry['games'] < provisional_games else k_factor
+    entry['rating'] += k * (score - expected)
+    entry['games'] += 1
+    entry['history'].append([date, round(entry['rating'], 1)])
+
+
+def process_match(ratings, match):
+    # match: {'key', 'date' (YYYY-MM-DD), 'teams': [name, name], 'winner': 0 or 1, 'players': [[ids], [ids]]}.
+    # Both teams and every player are rated against the other team's rating before the match.
+    entries = [ratings['teams'].setdefault(team, {'rating': initial_rating, 'games': 0, 'history': []})
+               for team in match['teams']]
+    before = [entry['rating'] for entry in entries]
+    for side, entry in enumerate(entries):
+        score = 1 if match['winner'] == side else 0
+        update_rating(entry, expected_score(before[side], before[1 - side]), score, match['date'])
+        for player_id in match['players'][side]:
+            player = ratings['players'].setdefault(player_id, {'rating': initial_rating, 'games': 0, 'history': []})
+            update_rating(player, expected_score(player['rating'], before[1 - side]), score, match['date'])
+    ratings['matches'].append(match['key'])
+    ratings['last_date'] = max(ratings['last_date'] or match['date'], match['date'])
+
+
+def rating_at(entry, date):
+    # Rating after the last match on or before date (YYYY-MM-DD); None before the first match
+    position = bisect.bisect_right(entry['history'], [date, float('inf')])
+    return entry['history'][position - 1][1] if position else None
+
+
+def team_key(name):
+    return ' '.join(name.split()).casefold()
+
+
+def match_day(match):
+    # (month, day, weekday) of a vlr.gg date ("Monday, July 8th"), which has no year
+    weekday, _, day = (match.get('date') or '').rpartition(',')
+    try:
+        parsed = datetime.datetime.strptime(re.sub(r'(\d+)(st|nd|rd|th)', r'\1', day.strip()) + ' 2000', '%B %d %Y')
+        weekday = time.strptime(weekday.strip(), '%A').tm_wday if weekday else None
+    except ValueError:
+        return None
+    return parsed.month, parsed.day, weekday
+
+
+def match_number(match):
+    number = re.search(r'vlr\.gg/(\d+)', match['url'])
+    return int(number.group(1)) if number else 0
+
+
+def match_year(match):
+    # Year in the event name or the URL; \b keeps match ids and team names like "2085" out
+    return re.search(r'\b202\d\b', match['event']) or re.search(r'\b202\d\b', match['url'])
+
+
+def match_date(match, year, end):
+    # The match's day in that year or the ones around it, the closest first, that falls on its weekday and not after
+    # end; None when there is none
+    month, day, weekday = match['day']
+    for candidate in [year, year - 1, year + 1]:
+        if month == 2 and day == 29 and candidate % 4:
+            continue
+        date = datetime.date(candidate, month, day)
+        if weekday in (None, date.weekday()) and date <= end:
+            return date
+    return None
+
+
+def date_matches(matches, latest=None):
+    # Dates of the matches. The year comes from the event name or the URL; vlr.gg match ids grow with time, so
+    # matches without one take the year of the closest earlier match that has one, plus one when their month comes
+    # first, and cannot be dated after the last match that has one. No match is dated after the end of the last year
+    # named, or after latest (YYYY-MM-DD, the latest date known from other data) when that is later, so the dates do
+    # not depend on the day of the run. Matches whose day fits no year are left undated.
+    years = [int(year.group()) for year in map(match_year, matches) if year]
+    if not years:
+        return
+    end = max(datetime.date(max(years), 12, 31), datetime.date.fromisoformat(latest or '0001-01-01'))
+    dated = []
+    for match in matches:
+        year = match_year(match)
+        date = match_date(match, int(year.group()), end) if year else None
+        if date:
+            match['date'] = date.isoformat()
+            dated.append((match_number(match), date.year, date.month))
+    if not dated:
+        return
+    dated.sort()
+    end = datetime.date.fromisoformat(max(match['date'] for match in matches if 'date' in match))
+    for match in matches:
+        if 'date' in match or match_year(match):
+            continue
+        _, year, month = dated[max(bisect.bisect_right(dated, (match_number(match), 9999, 99)) - 1, 0)]
+        date = match_date(match, year + (match['day'][0] < month), end)
+        if date:
+            match['date'] = date.isoformat()
+
+
+def vlr_matches(players, latest=None):
+    # Matches from the players' recent results, once per match URL, with every player placed on the side whose
+    # team name is one of their past teams; latest bounds their dates like in date_matches
+    matches = {}
+    for player in players:
+        results = player.get('recent_match_result')
+        if isinstance(results, str):
+            results = json.loads(results)
+        teams = {team_key(team['team_name']) for team in player.get('past_teams', [])}
+        for result in results or []:
+            scores = result.get('result') or {}
+            day = match_day(result)
+            if not result.get('url') or len(scores) != 2 or None in scores.values() or not day:
+                continue
+            names = list(scores)
+            values = [scores[name] for name in names]
+            if values[0] == values[1]:
+                continue
+            match = matches.setdefault(result['url'], {'key': result['url'], 'url': result['url'], 'day': day,
+                                                       'event': result.get('event') or '',
+                                                       'teams': [team_key(name) for name in names],
+                                                       'winner': int(values[1] > values[0]), 'players': [[], []]})
+            sides = [side for side, name in enumerate(match['teams']) if name in teams]
+            if len(sides) == 1 and player['player_id'] not in match['players'][sides[0]]:
+                match['players'][sides[0]].append(player['player_id'])
+    date_matches(list(matches.values()), latest)
+    return [{field: match[field] for field in ['key', 'date', 'teams', 'winner', 'players']}
+            for match in matches.values() if 'date' in match]
+
+
+def game_file_matches(root, known_matches):
+    # Downloaded games with a decided winner, with each team's players placed like "1.6. build-roster-history.py"
+    matches = []
+    for league in esports_data.leagues:
+        team_names = {team['id']: team['name'] for team in esports_data.read_esports_data(root, league, 'teams.json')}
+        home_teams = {player['id']: player.get('home_team_id')
+                      for player in esports_data.read_esports_data(root, league, 'players.json')}
+        for mapping in esports_data.read_esports_data(root, league, 'mapping_data.json'):
+            if mapping['platformGameId'] in known_matches:
+                continue
+            rosters = esports_data.game_rosters(mapping, home_teams)
+            path = esports_data.find_game_file(root, league, mapping['platformGameId']) if rosters else None
+            if path is None:
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                events = json.load(f)
+            date = next((event['metadata']['wallTime'][:10] for event in events
+                         if event.get('metadata', {}).get('wallTime')), None)
+            winner = next((str(event['gameDecided'].get('winningTeam', {}).get('value')) for event in events
+                           if 'gameDecided' in event), None)
+            team_ids = list(rosters)
+            if not date or mapping['teamMapping'].get(winner) not in team_ids:
+                continue
+            matches.append({'key': mapping['platformGameId'], 'date': date,
+                            'teams': [team_key(team_names.get(team_id, team_id)) for team_id in team_ids],
+                            'winner': team_ids.index(mapping['teamMapping'][winner]),
+                            'players': [rosters[team_id] for team_id in team_ids]})
+    return matches
+
+
+def same_series(match, series):
+    # Whether a game file's match is a map of one of the vlr.gg series ({(date, teams)}): the same two teams within a
+    # day, since vlr.gg shows US Pacific dates and game files UTC times
+    day = datetime.date.fromisoformat(match['date'])
+    return any(((day + datetime.timedelta(days=shift)).isoformat(), frozenset(match['teams'])) in series
+               for shift in (-1, 0, 1))
+
+
+def build_ratings(players, root='..', ratings=None):
+    # Processes every match not yet in the ratings, oldest first; game files of a vlr.gg series are left out, as the
+    # series result already counts. When a new match is older than the last one processed, every match is
+    # processed again from the start instead, so a rerun ends with the ratings of a full run. Returns the ratings,
+    # the number of matches processed and whether they were rebuilt.
+    ratings = ratings or new_ratings()
+    known_matches = set(ratings['matches'])
+    games = game_file_matches(root, known_matches)
+    # The games already processed are not read again, but none is later than the ratings' last date
+    latest = max([match['date'] for match in games] + [ratings['last_date'] or ''])
+    series = vlr_matches(players, latest or None)
+    played = {(match['date'], frozenset(match['teams'])) for match in series}
+    matches = [match for match in series if match['key'] not in known_matches]
+    matches += [match for match in games if not same_series(match, played)]
+    if ratings['last_date'] and any(match['date'] < ratings['last_date'] for match in matches):
+        ratings, processed, _ = build_ratings(players, root)
+        return ratings, processed, True
+    matches.sort(key=lambda match: match['date'])
+    for match in matches:
+        process_match(ratings, match)
+    return ratings, len(matches), False
+
+
+if __name__ == '__main__':
+    player_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join('lambda', 'preprocessed_players.json')
+    root = sys.argv[2] if len(sys.argv) > 2 else '..'
+    output_file = sys.argv[3] if len(sys.argv) > 3 else os.path.join('lambda', 'ratings.json')
+    with open(player_file, 'r', encoding='utf-8') as f:
+        players = json.load(f)
+    ratings = None
+    if os.path.isfile(output_file):
+        with open(output_file, 'r', encoding='utf-8') as f:
+            ratings = json.load(f)
+    ratings, processed, rebuilt = build_ratings(players, root, ratings)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(ratings, f, ensure_ascii=False, separators=(',', ':'))
+    rerun = ' from the start, as some were older than the previous run' if rebuilt else ''
+    print(f"Processed {processed} matches{rerun}; {len(ratings['teams'])} teams and {len(ratings['players'])} players "
+          f"rated in {output_file}")
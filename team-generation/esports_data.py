@@ -0,0 +1,66 @@
+import bisect
+import json
+import os
+import re
+
+# Readers shared by the builders ("1.4. build-stat-cube.py" to "1.7. build-ratings.py") for the esports data under
+# <league>/esports-data and the game files written by download_gamedata.py under <league>/games/<year>
+
+leagues = ['game-changers', 'vct-international', 'vct-challengers']
+years = [2022, 2023, 2024]
+
+
+def read_esports_data(root, league, name):
+    path = os.path.join(root, league, 'esports-data', name)
+    if not os.path.isfile(path):
+        print(f'{name} not found for {league}, skipping')
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def tournament_years(tournaments):
+    # Year of every tournament, from the year in its name. Tournament ids grow with time, so tournaments without a
+    # year in their name take the year of the closest earlier tournament that has one; None when no name has a year.
+    named = sorted((int(tournament['id']), int(year.group())) for tournament in tournaments
+                   for year in [re.search(r'20\d\d', tournament['name'])] if year)
+    years_by_id = {}
+    for tournament in tournaments:
+        position = bisect.bisect_right(named, (int(tournament['id']), 9999))
+        years_by_id[tournament['id']] = named[max(position - 1, 0)][1] if named else None
+    return years_by_id
+
+
+def game_sides(mapping):
+    # In-game player numbers 1-5 are one team and 6-10 the other
+    sides = [[], []]
+    for number, player_id in mapping['participantMapping'].items():
+        sides[int(number) > 5].append(player_id)
+    return sides
+
+
+def game_rosters(mapping, home_teams=None):
+    # {team id: player ids} of one game, or {} unless it has two different teams. The team with the higher in-game id
+    # is usually players 1-5, unless the players' current teams ({player id: team id}) say otherwise.
+    sides = game_sides(mapping)
+    team_ids = [team_id for _, team_id in sorted(mapping['teamMapping'].items(), key=lambda item: -int(item[0]))]
+    if len(team_ids) != 2 or team_ids[0] == team_ids[1]:
+        return {}
+    home_teams = home_teams or {}
+    kept = sum(home_teams.get(player_id) == team_id for side, team_id in zip(sides, team_ids) for player_id in side)
+    swapped = sum(home_teams.get(player_id) == team_id
+                  for side, team_id in zip(sides, reversed(team_ids)) for player_id in side)
+    if swapped > kept:
+        team_ids.reverse()
+    return dict(zip(team_ids, sides))
+
+
+def game_file_path(root, league, year, platform_game_id):
+    # download_gamedata.py replaces the characters Windows does not allow in file names
+    return os.path.join(root, league, 'games', str(year), re.sub(r'[<>:]', '_', platform_game_id) + '.json')
+
+
+def find_game_file(root, league, platform_game_id):
+    # Path of the downloaded game file, or None when it was not downloaded
+    paths = [game_file_path(root, league, year, platform_game_id) for year in years]
+    return next((path for path in paths if os.path.isfile(path)), None)
@@ -1,7 +1,35 @@
 import json
 import random
 import math
+import base64
+import bisect
 import copy
+import cProfile
+import gzip
+import heapq
+import io
+import itertools
+import logging
+import pstats
+import tempfile
+import time
+import tracemalloc
+import os
+import multiprocessing
+import multiprocessing.connection
+
+import coplay_graph
+import ratings
+import result_cache
+import roster_history
+import stat_cube
+
+# Structured log lines (one JSON object per line) for timings and profiles
+logger = logging.getLogger('team_generation')
+logger.setLevel(logging.INFO)
+
+# Where opt-in request profiles are written
+profile_dir = os.environ.get('TEAM_PROFILE_DIR', tempfile.gettempdir())
 
 # Agent to Role Mapping (if needed)
 agent_role_mapping = {
@@ -34,57 +62,592 @@ league_weights = {
     'game-changers': 0.5
 }
 
+# Weight of leagues missing from league_weights
+default_league_weight = 0.7
+
+# Columns of the stats matrix and of the role score matrix
+score_stats = ['acs', 'kd_ratio', 'assist_score', 'map_awareness', 'team_survival_trade_efficiency', 'adr',
+               'clutch_factor', 'rating_strength', 'recent_form']
+score_roles = ['Duelist', 'Initiator', 'Controller', 'Sentinel', 'Flex']
+
+# How stats are scaled to comparable ranges: 'max' (divide by the roster max), 'percentile' or 'zscore'
+normalization_method = os.environ.get('TEAM_NORMALIZATION', 'max')
+
+# Relative drift of a percentile or z-score scale that upserted players may cause before everyone is rescaled
+rescale_tolerance = 0.01
+
+# Nodes (about 0.25 to 1 ms each) or seconds after which the 'exact' engine returns its best team so far without
+# proving it optimal; requests can set a longer time_budget
+exact_node_limit = 5000
+exact_time_budget = 3
+
+# Share of the Lambda invocation's remaining time a search may use, leaving the rest for the response
+lambda_time_share = 0.5
+
+# Fewest islands the 'island' engine runs by default, also on machines (and Lambda sizes) with fewer cores
+min_default_islands = 4
+
+# Handle suggestions: minimum trigram similarity and default number returned
+min_handle_similarity = 0.3
+default_suggestion_limit = 5
+
+# Lineups accepted by one evaluate request
+max_evaluate_lineups = 5000
+
+# Map pools whose role scores are kept between requests
+max_map_score_entries = 16
+
+# Player fields returned by similarity searches
+similarity_fields = ['player_id', 'handle', 'league', 'current_region', 'roles', 'role_scores']
+
+# Named weight profiles selectable per request; reloaded whenever the file changes
+weight_profiles_file = os.environ.get('TEAM_WEIGHT_PROFILES',
+                                      os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                   'weight_profiles.json'))
+
+# Preprocessed player data shipped with the function
+player_data_file = 'preprocessed_players.json'
+
+# Player fields returned in compact mode
+compact_fields = ['player_id', 'handle', 'roles', 'assigned_role', 'role_scores']
+
+# Player fields a `fields` projection can name
+player_fields = ['player_id', 'handle', 'league', 'current_region', 'previous_regions', 'nationality', 'roles',
+                 'assigned_role', 'role_scores', 'acs', 'kd_ratio', 'assist_score', 'map_awareness',
+                 'team_survival_trade_efficiency', 'adr', 'clutch_factor', 'rating', 'rating_strength',
+                 'recent_form', 'role_versatility', 'agent_specialization', 'past_teams', 'latest_news',
+                 'recent_match_result']
+
+# Smaller response bodies are not worth compressing
+gzip_min_bytes = 1024
+
+# Seed used for cached results when the request does not give one
+default_seed = 0
+
+# Penalty weights
+missing_role_penalty = 10
+constraint_penalty = 25
+
+# Pair chemistry components
+base_chemistry = 0.1
+nationality_chemistry = 0.5
+region_chemistry = 0.3
+past_team_chemistry = 0.2
+coplay_chemistry = 0.3  # At full co-play strength, when a co-play graph is deployed
+max_pair_chemistry = base_chemistry + nationality_chemistry + region_chemistry + past_team_chemistry + coplay_chemistry
+
+
+def split_data_paths(file_path):
+    # Hot table and cold store written by "1.3. split-player-data.py" next to the preprocessed data
+    base_path = file_path[:-len('.json')] if file_path.endswith('.json') else file_path
+    return base_path + '.hot.json', base_path + '.cold.jsonl'
+
+
+def active_data_path(file_path):
+    hot_path, _ = split_data_paths(file_path)
+    try:
+        result_cache.data_version(hot_path)  # Checked at most once per version_check_seconds
+    except OSError:
+        return file_path
+    return hot_path
+
 
 def load_preprocessed_data(file_path='preprocessed_players.json'):
+    # Prefer the compact hot table when it exists; news, match results, agent specialization and past team periods
+    # then stay in the cold store until construct_output reads them for the final team
+    hot_path, cold_path = split_data_paths(file_path)
+    if os.path.exists(hot_path):
+        with open(hot_path, 'r', encoding='utf-8') as f:
+            players = json.load(f)
+        for player in players:
+            player['cold_store'] = cold_path
+        return players
     with open(file_path, 'r', encoding='utf-8') as f:
         players = json.load(f)
     return players
 
 
-def normalize_player_stats(players):
-    stats = ['acs', 'kd_ratio', 'assist_score', 'map_awareness',
-             'team_survival_trade_efficiency', 'adr', 'clutch_factor']
-    max_values = {stat: max([player.get(stat, 0) for player in players]) for stat in stats}
-    for player in players:
-        for stat in stats:
-            if max_values[stat] > 0:
-                player[stat] = player.get(stat, 0) / max_values[stat]
+def load_cold_fields(team):
+    # Merge each player's cold record back in; players loaded from the full file are returned unchanged
+    players = []
+    for player in team:
+        if 'cold_offset' in player:
+            with open(player['cold_store'], 'rb') as f:
+                f.seek(player['cold_offset'])
+                cold = json.loads(f.read(player['cold_length']).decode('utf-8'))
+            player = {field: value for field, value in player.items()
+                      if field not in ('cold_store', 'cold_offset', 'cold_length')}
+            player.update(cold)
+        players.append(player)
+    return players
+
+
+# Raw stat values, lookup rows and normalization scale of the last normalized roster, kept for upsert_players
+stat_index = {}
+
+
+def build_stat_index(players, method):
+    stat_index.clear()
+    stat_index.update(players=players, method=method, version=0, scale={}, stale={}, max={}, sum={}, sum_sq={},
+                      sorted={})
+    stat_index['rows'] = {(player.get('player_id'), player.get('handle')): row for row, player in enumerate(players)}
+    stat_index['raw'] = {stat: [player.get(stat, 0) for player in players] for stat in score_stats}
+    for stat, values in stat_index['raw'].items():
+        stat_index['max'][stat] = max(values) if values else 0
+        stat_index['sum'][stat] = sum(values)
+        stat_index['sum_sq'][stat] = sum(value * value for value in values)
+        if method == 'percentile':
+            stat_index['sorted'][stat] = sorted(values)
+
+
+def current_scale(stat):
+    method = stat_index['method']
+    if method == 'percentile':
+        return {'count': len(stat_index['raw'][stat])}
+    if method == 'zscore':
+        count = len(stat_index['raw'][stat])
+        mean = stat_index['sum'][stat] / count if count else 0.0
+        variance = stat_index['sum_sq'][stat] / count - mean * mean if count else 0.0
+        return {'mean': mean, 'std': math.sqrt(max(variance, 0.0))}
+    return {'max': stat_index['max'][stat]}
+
+
+def normalize_value(stat, value):
+    method = stat_index['method']
+    scale = stat_index['scale'][stat]
+    if method == 'percentile':
+        sorted_values = stat_index['sorted'][stat]
+        return bisect.bisect_right(sorted_values, value) / len(sorted_values) if sorted_values else 0.0
+    if method == 'zscore':
+        return (value - scale['mean']) / scale['std'] if scale['std'] > 0 else 0.0
+    return value / scale['max'] if scale['max'] > 0 else 0.0
+
+
+def rescale_stat(players, stat):
+    # Fix the stat's scale to the current values and renormalize every player
+    stat_index['scale'][stat] = current_scale(stat)
+    stat_index['stale'][stat] = 0
+    for player, value in zip(players, stat_index['raw'][stat]):
+        player[stat] = normalize_value(stat, value)
+
+
+def needs_rescale(stat):
+    # Max scaling is exact, so any new max rescales; percentile and z-score scales may drift up to rescale_tolerance
+    method = stat_index['method']
+    scale = stat_index['scale'][stat]
+    live = current_scale(stat)
+    if method == 'percentile':
+        return stat_index['stale'][stat] > rescale_tolerance * live['count']
+    if method == 'zscore':
+        return abs(live['mean'] - scale['mean']) > rescale_tolerance * scale['std'] or \
+            abs(live['std'] - scale['std']) > rescale_tolerance * scale['std']
+    return live['max'] != scale['max']
+
+
+def update_stat(stat, row, value):
+    # Replace (or append, for a new row) one raw value and keep the running max, sums and sorted values current
+    values = stat_index['raw'][stat]
+    old = values[row] if row < len(values) else None
+    if old is None:
+        values.append(value)
+    else:
+        values[row] = value
+        stat_index['sum'][stat] -= old
+        stat_index['sum_sq'][stat] -= old * old
+    stat_index['sum'][stat] += value
+    stat_index['sum_sq'][stat] += value * value
+    if old is not None and old == stat_index['max'][stat] and value < old:
+        stat_index['max'][stat] = max(values)
+    else:
+        stat_index['max'][stat] = max(stat_index['max'][stat], value) if len(values) > 1 else value
+    if stat_index['method'] == 'percentile':
+        sorted_values = stat_index['sorted'][stat]
+        if old is not None:
+            del sorted_values[bisect.bisect_left(sorted_values, old)]
+        bisect.insort(sorted_values, value)
+    stat_index['stale'][stat] += 1
+
+
+def normalize_player_stats(players, method=None):
+    # Scale each stat with normalization_method; the raw values stay in stat_index for upsert_players
+    build_stat_index(players, method or normalization_method)
+    for stat in score_stats:
+        rescale_stat(players, stat)
+    return players
+
+
+def matrix_multiply(a, b):
+    columns = list(zip(*b))
+    return [[sum(x * y for x, y in zip(row, column)) for column in columns] for row in a]
+
+
+def weight_matrix(profile):
+    # stats x roles matrix of a profile's role weights
+    return [[profile['role_weights'].get(role, {}).get(stat, 0) for role in score_roles] for stat in score_stats]
+
+
+# Built-in profile, also used when the profiles file is missing
+default_weight_profile = {'role_weights': role_weights, 'league_weights': league_weights,
+                          'default_league_weight': default_league_weight}
+
+# Loaded profiles, the version (mtime and size) of the file they were read from and why rejected profiles were
+weight_profiles = {'version': None, 'profiles': {'default': default_weight_profile}, 'errors': {}}
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def check_weight_profile(profile):
+    # Returns an error message for a malformed profile, None when it can score players. Every role needs weights;
+    # stats a role does not list weigh 0.
+    if not isinstance(profile, dict) or not isinstance(profile.get('role_weights'), dict) or \
+            not isinstance(profile.get('league_weights'), dict):
+        return 'a profile must be an object with role_weights and league_weights objects'
+    for role in score_roles:
+        weights = profile['role_weights'].get(role)
+        if not isinstance(weights, dict):
+            return f'role_weights has no weights for {role}'
+        unknown_stats = [stat for stat in weights if stat not in score_stats]
+        if unknown_stats:
+            return f"unknown stat(s) for {role}: {', '.join(unknown_stats)}"
+        if not all(is_number(weight) for weight in weights.values()):
+            return f'weights for {role} must be numbers'
+    if not all(is_number(weight) for weight in profile['league_weights'].values()):
+        return 'league_weights must be numbers'
+    if 'default_league_weight' in profile and not is_number(profile['default_league_weight']):
+        return 'default_league_weight must be a number'
+    return None
+
+
+def load_weight_profiles():
+    # Re-read the profiles file when it has changed since the last request. 'default' is always the built-in
+    # profile, so the weights above are the only copy of the default scoring. A malformed profile is left out and
+    # a malformed file leaves only the default, so a bad edit never breaks the other requests.
+    try:
+        version = result_cache.data_version(weight_profiles_file)
+    except OSError:
+        version = None
+    if version != weight_profiles['version']:
+        profiles = {}
+        errors = {}
+        if version is not None:
+            try:
+                with open(weight_profiles_file, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+            except (OSError, ValueError) as e:
+                loaded = {}
+                errors[None] = f'{weight_profiles_file} could not be read: {e}'
+            if not isinstance(loaded, dict):
+                loaded = {}
+                errors[None] = f'{weight_profiles_file} must hold an object of named profiles'
+            for name, profile in loaded.items():
+                error = check_weight_profile(profile)
+                if error:
+                    errors[name] = error
+                else:
+                    profiles[name] = profile
+        for name, error in errors.items():
+            logger.warning(json.dumps({'event': 'weight_profile_rejected', 'profile': name, 'error': error}))
+        profiles['default'] = default_weight_profile
+        weight_profiles['profiles'] = profiles
+        weight_profiles['errors'] = errors
+        weight_profiles['version'] = version
+    return weight_profiles['profiles']
+
+
+def unknown_profile_error(name):
+    # Why a profile name cannot be used: rejected on load, or not defined at all
+    if name in weight_profiles['errors']:
+        return f"Weight profile {name} is invalid: {weight_profiles['errors'][name]}"
+    if None in weight_profiles['errors']:
+        return f"Unknown weight profile: {name} ({weight_profiles['errors'][None]})"
+    return f'Unknown weight profile: {name}'
+
+
+# Stats matrix and role mask of the last scored roster, and the role scores of every profile and map pool applied
+# to it
+scoring_context = {}
+
+
+def build_scoring_context(players):
+    # The roster-dependent half of the product, built once per roster
+    scoring_context.clear()
+    scoring_context['players'] = players
+    scoring_context['stats'] = [[player.get(stat, 0) for stat in score_stats] for player in players]
+    scoring_context['mask'] = [[role == 'Flex' or role in player['roles'] for role in score_roles]
+                               for player in players]
+    scoring_context['leagues'] = [player.get('league') for player in players]
+    scoring_context['scores'] = {}
+    scoring_context['map_scores'] = {}
+
+
+def score_matrix(stats, leagues, masks, profile):
+    # (players x stats) . (stats x roles), scaled by each player's league weight and masked to the playable roles
+    products = matrix_multiply(stats, weight_matrix(profile))
+    league_vector = [profile['league_weights'].get(league, profile.get('default_league_weight', default_league_weight))
+                     for league in leagues]
+    return [{role: score * league_weight for role, score, eligible in zip(score_roles, product, mask) if eligible}
+            for product, league_weight, mask in zip(products, league_vector, masks)]
+
+
+def profile_role_scores(profile, rows=None):
+    # Role scores of the scored roster, or only of the given rows when rows is set
+    if rows is None:
+        rows = range(len(scoring_context['stats']))
+    return score_matrix([scoring_context['stats'][row] for row in rows],
+                        [scoring_context['leagues'][row] for row in rows],
+                        [scoring_context['mask'][row] for row in rows], profile)
+
+
+def calculate_player_scores(players, profile=None):
+    build_scoring_context(players)
+    for player, role_scores in zip(players, profile_role_scores(profile or default_weight_profile)):
+        player['role_scores'] = role_scores
+    return players
+
+
+def apply_weight_profile(players, name):
+    # Players rescored with a named profile, as copies so the shared roster keeps its default scores.
+    # Switching profiles costs one matrix product per profile and file version; later requests reuse the scores.
+    profiles = load_weight_profiles()
+    if name not in profiles:
+        return None
+    if scoring_context.get('players') is not players:
+        build_scoring_context(players)
+    key = (name, weight_profiles['version'])
+    if key not in scoring_context['scores']:
+        scoring_context['scores'][key] = profile_role_scores(profiles[name])
+    return [dict(player, role_scores=role_scores)
+            for player, role_scores in zip(players, scoring_context['scores'][key])]
+
+
+def apply_map_weights(players, maps, name=None):
+    # Players rescored for a map pool, as copies: each stat the stat cube covers is scaled by how the player does on
+    # those maps relative to all maps, then the whole roster is scored with one matrix product.
+    # Returns (players, error).
+    if not isinstance(maps, list) or not maps or not all(isinstance(map_name, str) for map_name in maps):
+        return None, 'maps must be a non-empty list of map names.'
+    profile = load_weight_profiles().get(name or 'default')
+    if profile is None:
+        return None, unknown_profile_error(name)
+    cube = stat_cube.load_stat_cube()
+    if cube is None:
+        return None, 'Map stats are not available: no stat cube has been built.'
+    unknown = sorted(set(maps) - set(cube['maps']))
+    if unknown:
+        return None, f"Unknown maps: {', '.join(unknown)}. Known maps: {', '.join(sorted(cube['maps']))}"
+    if scoring_context.get('players') is not players:
+        build_scoring_context(players)
+    key = (tuple(sorted(set(maps))), name or 'default', weight_profiles['version'], stat_cube.loaded_cube['version'])
+    if key not in scoring_context['map_scores']:
+        stats = []
+        for player, row in zip(players, scoring_context['stats']):
+            factors = stat_cube.map_factors(cube, player.get('player_id'), maps)
+            stats.append([value * factors.get(stat, 1) for stat, value in zip(score_stats, row)])
+        if len(scoring_context['map_scores']) >= max_map_score_entries:
+            del scoring_context['map_scores'][next(iter(scoring_context['map_scores']))]
+        scoring_context['map_scores'][key] = (score_matrix(stats, scoring_context['leagues'], scoring_context['mask'],
+                                                           profile), stats)
+    scores, stats = scoring_context['map_scores'][key]
+    return [dict(player, role_scores=role_scores, **dict(zip(score_stats, row)))
+            for player, role_scores, row in zip(players, scores, stats)], None
+
+
+def rescore_for_request(players, event, constraints):
+    # The roster scored with the request's weight profile and map pool; copies when either is set.
+    # Returns (players, error).
+    if event.get('weight_profile') is not None and not isinstance(event['weight_profile'], str):
+        return None, 'weight_profile must be a profile name.'
+    if constraints.get('maps') is not None:
+        return apply_map_weights(players, constraints['maps'], event.get('weight_profile'))
+    if event.get('weight_profile') is not None:
+        profiled = apply_weight_profile(players, event['weight_profile'])
+        if profiled is None:
+            return None, unknown_profile_error(event['weight_profile'])
+        return profiled, None
+    return players, None
+
+
+def rescore_players(players, rows):
+    # Recompute the role scores of the given rows (sorted; new rows at the end of the roster) for the default and
+    # every cached profile
+    if scoring_context.get('players') is not players:
+        calculate_player_scores(players)
+        return
+    for row in rows:
+        player = players[row]
+        entry = ([player.get(stat, 0) for stat in score_stats],
+                 [role == 'Flex' or role in player['roles'] for role in score_roles], player.get('league'))
+        for field, value in zip(['stats', 'mask', 'leagues'], entry):
+            if row < len(scoring_context[field]):
+                scoring_context[field][row] = value
+            else:
+                scoring_context[field].append(value)
+    for row, role_scores in zip(rows, profile_role_scores(default_weight_profile, rows)):
+        players[row]['role_scores'] = role_scores
+    scoring_context['map_scores'].clear()  # Recomputed per map pool on its next request
+    profiles = load_weight_profiles()
+    for key, scores in list(scoring_context['scores'].items()):
+        name, version = key
+        if name not in profiles or version != weight_profiles['version']:
+            del scoring_context['scores'][key]
+            continue
+        for row, role_scores in zip(rows, profile_role_scores(profiles[name], rows)):
+            if row < len(scores):
+                scores[row] = role_scores
             else:
-                player[stat] = 0.0
+                scores.append(role_scores)
+
+
+def check_player_updates(updates):
+    # Returns an error message for malformed upserts, None when they can be applied
+    if not isinstance(updates, list):
+        return 'players must be a list of player objects.'
+    for update in updates:
+        if not isinstance(update, dict) or 'player_id' not in update or 'handle' not in update:
+            return 'Each player must be an object with player_id and handle.'
+        for stat in score_stats:
+            if stat in update and (isinstance(update[stat], bool) or not isinstance(update[stat], (int, float))):
+                return f'{stat} of {update["handle"]} must be a number.'
+        if 'roles' in update and not isinstance(update['roles'], list):
+            return f'roles of {update["handle"]} must be a list.'
+    return None
+
+
+def upsert_players(players, updates):
+    # Insert or update players, matched by (player_id, handle), in the roster last loaded by load_player_data.
+    # Stats in the updates are raw values. Only the upserted players are renormalized and rescored unless a stat's
+    # scale moved, in which case that stat is rescaled and the whole roster rescored with one matrix product.
+    if stat_index.get('players') is not players:
+        raise ValueError('upsert_players needs the roster last normalized by normalize_player_stats')
+    rows = set()
+    added = 0
+    roster_history.clear_team_keys()
+    for update in updates:
+        key = (update.get('player_id'), update.get('handle'))
+        row = stat_index['rows'].get(key)
+        if row is None:
+            row = len(players)
+            players.append({'roles': []})
+            stat_index['rows'][key] = row
+            added += 1
+            update = dict({'rating_strength': ratings.rating_strength(ratings.player_rating(key[0])),
+                           'recent_form': recent_form(key[0])}, **update)
+        players[row].update({field: value for field, value in update.items() if field not in score_stats})
+        for stat in score_stats:
+            if stat in update or row == len(stat_index['raw'][stat]):
+                update_stat(stat, row, update.get(stat, 0))
+        rows.add(row)
+    rescaled = [stat for stat in score_stats if needs_rescale(stat)]
+    for stat in rescaled:
+        rescale_stat(players, stat)
+    for row in rows:
+        for stat in score_stats:
+            if stat not in rescaled:
+                players[row][stat] = normalize_value(stat, stat_index['raw'][stat][row])
+    if rescaled:
+        calculate_player_scores(players)
+    else:
+        rescore_players(players, sorted(rows))
+    stat_index['version'] += 1
+    return {'updated': len(rows) - added, 'added': added, 'rescaled': rescaled,
+            'rescored': len(players) if rescaled else len(rows), 'roster_version': stat_index['version']}
+
+
+def load_player_data(file_path=None, timings=None):
+    # Load preprocessed player data, recording the duration of each stage in timings when given
+    stage_start = time.perf_counter()
+    roster_history.clear_team_keys()
+    players = load_preprocessed_data(file_path or player_data_file)
+    stage_start = record_stage(timings, 'load_preprocessed_data', stage_start)
+    players = attach_ratings(players)
+    stage_start = record_stage(timings, 'attach_ratings', stage_start)
+    players = attach_recent_form(players)
+    stage_start = record_stage(timings, 'attach_recent_form', stage_start)
+    players = normalize_player_stats(players)
+    stage_start = record_stage(timings, 'normalize_player_stats', stage_start)
+    players = calculate_player_scores(players)
+    record_stage(timings, 'calculate_player_scores', stage_start)
     return players
 
 
-def calculate_player_scores(players):
+# Scored roster of player_data_file and the versions of the files it was built from, kept across warm invocations
+# together with the handle and similarity indexes built on it
+roster_cache = {}
+
+
+def get_player_data(timings=None):
+    # The cached roster, loaded and scored again only when the player data, ratings or stat cube have changed
+    key = (player_data_file, result_cache.data_version(active_data_path(player_data_file)),
+           ratings.loaded_ratings['version'] if ratings.load_ratings() is not None else None,
+           stat_cube.loaded_cube['version'] if stat_cube.load_stat_cube() is not None else None)
+    if roster_cache.get('key') != key:
+        roster_cache.clear()
+        roster_cache.update(key=key, players=load_player_data(timings=timings))
+    return roster_cache['players']
+
+
+def attach_ratings(players):
+    # Every player's Elo rating from "1.7. build-ratings.py" and its rating_strength score stat, the chance to beat an
+    # average opponent (0.5 for unrated players or without ratings) before normalize_player_stats scales it
+    ratings.load_ratings()
     for player in players:
-        player['role_scores'] = {}
-        player_league_weight = league_weights.get(player.get('league'), 0.7)
-        for role in ['Duelist', 'Initiator', 'Controller', 'Sentinel', 'Flex']:
-            if role in player['roles'] or role == 'Flex':
-                role_weight = role_weights[role]
-                score = sum(player.get(stat, 0) * weight for stat, weight in role_weight.items())
-                player['role_scores'][role] = score * player_league_weight
+        player['rating'] = ratings.player_rating(player.get('player_id'))
+        player['rating_strength'] = ratings.rating_strength(player['rating'])
     return players
 
 
+def recent_form(player_id):
+    # ACS over the stat cube's recent window relative to all time (stat_cube.form_factors); 1 without recent games
+    cube = stat_cube.loaded_cube['cube']
+    return stat_cube.form_factors(cube).get(player_id, 1) if cube is not None else 1
+
+
+def attach_recent_form(players):
+    # recent_form score stat of every player, from the stat cube's rolling windows
+    stat_cube.load_stat_cube()
+    for player in players:
+        player['recent_form'] = recent_form(player.get('player_id'))
+    return players
+
+
+def record_stage(timings, stage, stage_start):
+    # Store the seconds since stage_start under `stage` and return the start of the next stage.
+    # While tracemalloc is tracing, also store the stage's allocated and peak memory under timings['memory']
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = now - stage_start
+        if tracemalloc.is_tracing():
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            timings.setdefault('memory', {})[stage] = {'current_bytes': current_bytes, 'peak_bytes': peak_bytes}
+            tracemalloc.reset_peak()
+    return now
+
+
+def pair_chemistry(player1, player2):
+    chemistry = base_chemistry
+    # Shared nationality
+    if player1.get('nationality') and player2.get('nationality') and player1['nationality'] == player2[
+        'nationality']:
+        chemistry += nationality_chemistry
+    # Same region
+    if player1.get('current_region') and player2.get('current_region') and player1['current_region'] == player2[
+        'current_region']:
+        chemistry += region_chemistry
+    # Past team overlap, by official team id when a roster history is deployed
+    if not roster_history.past_team_keys(player1).isdisjoint(roster_history.past_team_keys(player2)):
+        chemistry += past_team_chemistry
+    # Recent games played together on the same team
+    chemistry += coplay_chemistry * coplay_graph.coplay_strength(player1.get('player_id'), player2.get('player_id'))
+    return chemistry
+
+
 def calculate_chemistry(team):
     total_chemistry = 0
     pairs = [(team[i], team[j]) for i in range(len(team)) for j in range(i + 1, len(team))]
     for player1, player2 in pairs:
-        chemistry = 0.1  # Base chemistry
-        # Shared nationality
-        if player1.get('nationality') and player2.get('nationality') and player1['nationality'] == player2[
-            'nationality']:
-            chemistry += 0.5
-        # Same region
-        if player1.get('current_region') and player2.get('current_region') and player1['current_region'] == player2[
-            'current_region']:
-            chemistry += 0.3
-        # Past team overlap
-        past_teams1 = [team['team_name'] for team in player1.get('past_teams', [])]
-        past_teams2 = [team['team_name'] for team in player2.get('past_teams', [])]
-        if set(past_teams1) & set(past_teams2):
-            chemistry += 0.2
-        total_chemistry += chemistry
+        total_chemistry += pair_chemistry(player1, player2)
     # Normalize chemistry score to 1-100 scale
     max_possible_pairs = len(pairs)
     if max_possible_pairs > 0:
@@ -94,13 +657,69 @@ def calculate_chemistry(team):
     return chemistry_score
 
 
-def generate_initial_population(players, constraints, population_size=50):
+def build_candidate_pools(players):
+    # Index players by role once, sorted by role score, so teams can be built without rescanning the roster
+    pools = {'roles': {}, 'tie_ends': {}, 'by_handle': {}}
+    for role in ['Duelist', 'Initiator', 'Controller', 'Sentinel', 'Flex']:
+        if role == 'Flex':
+            # 'Flex' is open to players who can play multiple roles
+            candidates = [p for p in players if len(p['roles']) >= 2]
+        else:
+            candidates = [p for p in players if role in p['roles']]
+        candidates.sort(key=lambda p: p['role_scores'].get(role, 0), reverse=True)
+        # tie_ends[i] is the index just past the run of equal scores that contains position i
+        tie_ends = [0] * len(candidates)
+        end = len(candidates)
+        for i in range(len(candidates) - 1, -1, -1):
+            if i + 1 < len(candidates) and \
+                    candidates[i]['role_scores'].get(role, 0) != candidates[i + 1]['role_scores'].get(role, 0):
+                end = i + 1
+            tie_ends[i] = end
+        pools['roles'][role] = candidates
+        pools['tie_ends'][role] = tie_ends
+    for player in players:
+        pools['by_handle'].setdefault(player.get('handle'), []).append(player)
+    return pools
+
+
+def sample_unassigned(candidates, start, end, assigned_player_ids):
+    # At most five players are ever assigned, so rejection sampling settles in a few draws on any sizeable range
+    if end - start > 2 * len(assigned_player_ids):
+        while True:
+            player = candidates[random.randrange(start, end)]
+            if player['player_id'] not in assigned_player_ids:
+                return player
+    remaining = [p for p in candidates[start:end] if p['player_id'] not in assigned_player_ids]
+    return random.choice(remaining) if remaining else None
+
+
+def pick_best_candidate(pools, role, assigned_player_ids):
+    # Highest role score among unassigned players, ties broken at random
+    candidates = pools['roles'][role]
+    tie_ends = pools['tie_ends'][role]
+    start = 0
+    while start < len(candidates):
+        player = sample_unassigned(candidates, start, tie_ends[start], assigned_player_ids)
+        if player:
+            return player
+        start = tie_ends[start]
+    return None
+
+
+def pick_random_candidate(pools, role, assigned_player_ids):
+    candidates = pools['roles'][role]
+    return sample_unassigned(candidates, 0, len(candidates), assigned_player_ids)
+
+
+def generate_initial_population(players, constraints, population_size=50, pools=None):
     population = []
     eligible_players = filter_players_by_constraints(players, constraints)
     if not eligible_players:
         return population  # No eligible players
+    if pools is None:
+        pools = build_candidate_pools(eligible_players)
     for _ in range(population_size * 2):  # Try more times to find valid teams
-        team = create_random_team(eligible_players, constraints)
+        team = create_random_team(eligible_players, constraints, pools)
         if team:
             population.append(team)
         if len(population) >= population_size:
@@ -121,7 +740,8 @@ def filter_players_by_constraints(players, constraints):
         filtered_players = [p for p in filtered_players if p.get('current_region') in region_list]
     # Apply player inclusion constraints
     if 'player' in constraints and constraints['player']:
-        included_players = [p for p in players if p.get('handle') in constraints['player']]
+        included_handles = set(constraints['player'])
+        included_players = [p for p in players if p.get('handle') in included_handles]
         # Combine filtered_players and included_players, removing duplicates based on 'player_id'
         all_players = filtered_players + included_players
         unique_players = {p['player_id']: p for p in all_players}
@@ -129,11 +749,334 @@ def filter_players_by_constraints(players, constraints):
     return filtered_players
 
 
-def create_random_team(players, constraints):
+# Exact, case-folded and trigram lookups over the handles of the last indexed roster; with roster_cache it lasts
+# across warm invocations
+handle_index = {}
+
+
+def fold_handle(handle):
+    return handle.strip().casefold()
+
+
+def handle_trigrams(folded):
+    padded = f'  {folded} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def get_handle_index(players):
+    # Built once per roster and rebuilt when upserts add players. A player_id can appear under several handles
+    # (renames and spelling variants across leagues), which are listed as aliases of each other. The trigrams are
+    # only built by get_handle_trigrams, when a handle has no exact or case-folded match.
+    if handle_index.get('players') is players and handle_index['size'] == len(players):
+        return handle_index
+    handle_index.clear()
+    handle_index.update(players=players, size=len(players), exact={}, folded={}, trigrams=None, aliases={})
+    for player in players:
+        handle = player.get('handle')
+        if not handle:
+            continue
+        handles = handle_index['aliases'].setdefault(player.get('player_id'), [])
+        if handle not in handles:
+            handles.append(handle)
+        if handle not in handle_index['exact']:
+            handle_index['exact'][handle] = []
+            handle_index['folded'].setdefault(fold_handle(handle), []).append(handle)
+        handle_index['exact'][handle].append(player)
+    return handle_index
+
+
+def get_handle_trigrams(index):
+    # Case-folded handles by trigram, built on the first fuzzy lookup of the indexed roster
+    if index['trigrams'] is None:
+        index['trigrams'] = {}
+        for folded in index['folded']:
+            for trigram in handle_trigrams(folded):
+                index['trigrams'].setdefault(trigram, set()).add(folded)
+    return index['trigrams']
+
+
+def handle_players(index, handle):
+    return [{'player_id': player.get('player_id'), 'league': player.get('league'),
+             'current_region': player.get('current_region'),
+             'aliases': [alias for alias in index['aliases'][player.get('player_id')] if alias != handle]}
+            for player in index['exact'][handle]]
+
+
+def suggest_handles(players, query, limit=default_suggestion_limit):
+    # Ranked handle matches for a query: exact, then case-insensitive, then by trigram similarity
+    index = get_handle_index(players)
+    trigrams = get_handle_trigrams(index)
+    folded = fold_handle(query)
+    query_trigrams = handle_trigrams(folded)
+    shared_counts = {}
+    for trigram in query_trigrams:
+        for candidate in trigrams.get(trigram, ()):
+            shared_counts[candidate] = shared_counts.get(candidate, 0) + 1
+    ranked = []
+    for candidate, shared in shared_counts.items():
+        similarity = shared / (len(query_trigrams) + len(handle_trigrams(candidate)) - shared)
+        if similarity >= min_handle_similarity or candidate == folded:
+            for handle in index['folded'][candidate]:
+                match = 'exact' if handle == query else 'casefold' if candidate == folded else 'fuzzy'
+                ranked.append((['exact', 'casefold', 'fuzzy'].index(match), -similarity, handle, match))
+    ranked.sort()
+    return [{'handle': handle, 'match': match, 'similarity': round(-similarity, 3),
+             'players': handle_players(index, handle)}
+            for _, similarity, handle, match in ranked[:limit]]
+
+
+def resolve_constraint_handles(players, constraints):
+    # Map required handles to roster handles, ignoring case and surrounding spaces when that names one player.
+    # Returns the constraints and an error naming the handles that could not be resolved, with suggestions.
+    if not constraints.get('player'):
+        return constraints, None
+    index = get_handle_index(players)
+    resolved = []
+    unresolved = []
+    for handle in constraints['player']:
+        if handle in index['exact']:
+            resolved.append(handle)
+            continue
+        if not isinstance(handle, str):
+            unresolved.append(str(handle))
+            continue
+        matches = index['folded'].get(fold_handle(handle), [])
+        # Spelling variants of the same player_id all stand for that player
+        if matches and len({frozenset(p.get('player_id') for p in index['exact'][match]) for match in matches}) == 1:
+            resolved.append(matches[0])
+            continue
+        suggestions = [suggestion['handle'] for suggestion in suggest_handles(players, handle, 3)]
+        unresolved.append(f"{handle} (did you mean {', '.join(suggestions)}?)" if suggestions else handle)
+    if unresolved:
+        return constraints, 'Unknown player handle(s): ' + ', '.join(unresolved)
+    return dict(constraints, player=resolved), None
+
+
+# Stat and role score vectors of the last indexed roster, for nearest-neighbour search; with roster_cache it lasts
+# across warm invocations
+similarity_index = {}
+
+
+def player_vector(player):
+    return [player.get(stat, 0) for stat in score_stats] + [player['role_scores'].get(role, 0) for role in score_roles]
+
+
+def get_similarity_index(players):
+    # Rebuilt when the roster changes, including upserts, which bump the roster version. Rows are bucketed by
+    # (role, league, region), role None holding every row, so filtered searches only measure their own buckets.
+    version = stat_index.get('version') if stat_index.get('players') is players else None
+    if similarity_index.get('players') is players and similarity_index['size'] == len(players) and \
+            similarity_index['version'] == version:
+        return similarity_index
+    similarity_index.clear()
+    similarity_index.update(players=players, size=len(players), version=version,
+                            vectors=[player_vector(player) for player in players], buckets={})
+    for row, player in enumerate(players):
+        for role in [None] + [role for role in score_roles if can_play(player, role)]:
+            key = (role, player.get('league'), player.get('current_region'))
+            similarity_index['buckets'].setdefault(key, []).append(row)
+    return similarity_index
+
+
+def can_play(player, role):
+    # 'Flex' is open to players who can play multiple roles
+    return len(player['roles']) >= 2 if role == 'Flex' else role in player['roles']
+
+
+def similar_players(players, target, k=5, leagues=None, regions=None, role=None, exclude=()):
+    # The k players closest to target by Euclidean distance over normalized stats and role scores, optionally
+    # limited to leagues, regions and players who can take a role. The target's player_id and the players behind
+    # the excluded handles (e.g. the rest of a lineup) are skipped, and each player_id is returned once, under its
+    # closest handle.
+    index = get_similarity_index(players)
+    handles = get_handle_index(players)['exact']
+    excluded_ids = {target.get('player_id')} | {player.get('player_id') for handle in exclude
+                                                 for player in handles.get(handle, [])}
+    query = player_vector(target)
+    vectors = index['vectors']
+    candidates = [(math.dist(query, vectors[row]), row)
+                  for (bucket_role, league, region), rows in index['buckets'].items()
+                  if bucket_role == role and (leagues is None or league in leagues)
+                  and (regions is None or region in regions)
+                  for row in rows if players[row].get('player_id') not in excluded_ids]
+    heapq.heapify(candidates)
+    matches = []
+    while candidates and len(matches) < k:
+        distance, row = heapq.heappop(candidates)
+        if players[row].get('player_id') not in excluded_ids:
+            excluded_ids.add(players[row].get('player_id'))
+            matches.append((distance, players[row]))
+    return matches
+
+
+# Keys a constraints object and its region object can hold
+constraint_keys = ['league', 'region', 'player', 'maps']
+region_constraint_keys = ['diversity', 'region_list']
+
+
+def check_constraints(constraints):
+    # Returns an error message for constraints of the wrong shape or type, None when they can be normalized. Map
+    # names are checked against the stat cube by apply_map_weights.
+    if not isinstance(constraints, dict):
+        return 'constraints must be an object.'
+    unknown = [str(key) for key in constraints if key not in constraint_keys]
+    if unknown:
+        return f"Unknown constraint(s): {', '.join(unknown)}. Known constraints: {', '.join(constraint_keys)}"
+    if 'league' in constraints:
+        if not isinstance(constraints['league'], dict):
+            return 'league must be an object of {min, max, exact} counts by league.'
+        for league, req in constraints['league'].items():
+            if not isinstance(req, dict) or not req or any(key not in ('min', 'max', 'exact') for key in req):
+                return f'league {league} must be an object with min, max or exact.'
+            for key, count in req.items():
+                if not isinstance(count, int) or isinstance(count, bool) or not 0 <= count <= 5:
+                    return f'{key} of league {league} must be an integer from 0 to 5.'
+    if 'region' in constraints:
+        region = constraints['region']
+        if not isinstance(region, dict) or any(key not in region_constraint_keys for key in region):
+            return 'region must be an object with diversity and/or region_list.'
+        diversity = region.get('diversity', 1)
+        if not isinstance(diversity, int) or isinstance(diversity, bool) or not 1 <= diversity <= 5:
+            return 'region diversity must be an integer from 1 to 5.'
+        region_list = region.get('region_list', [''])
+        if not isinstance(region_list, list) or not region_list or \
+                not all(isinstance(name, str) for name in region_list):
+            return 'region_list must be a non-empty list of region names.'
+    if 'player' in constraints and (not isinstance(constraints['player'], list)
+                                    or not all(isinstance(handle, str) for handle in constraints['player'])):
+        return 'player must be a list of player handles.'
+    return None
+
+
+def normalize_constraints(constraints):
+    # League constraints may be given as {'exact': n}, which is the same as {'min': n, 'max': n}.
+    # Returns (constraints, error).
+    error = check_constraints(constraints)
+    if error:
+        return None, error
+    constraints = dict(constraints)
+    if 'league' in constraints:
+        leagues = {}
+        for league, req in constraints['league'].items():
+            req = dict(req)
+            if 'exact' in req:
+                exact = req.pop('exact')
+                req.setdefault('min', exact)
+                req.setdefault('max', exact)
+            leagues[league] = req
+        constraints['league'] = leagues
+    if isinstance(constraints.get('maps'), list):
+        constraints['maps'] = [map_name.strip().lower() if isinstance(map_name, str) else map_name
+                               for map_name in constraints['maps']]
+    return constraints, None
+
+
+def check_constraints_feasibility(players, constraints):
+    # Cheap checks that reject constraints no team can satisfy, returning an error message or None
+    roles = ['Duelist', 'Initiator', 'Controller', 'Sentinel', 'Flex']
+    included_handles = constraints.get('player', [])
+    known_handles = set(p.get('handle') for p in players)
+    unknown_handles = [handle for handle in included_handles if handle not in known_handles]
+    if unknown_handles:
+        return 'Unknown player handle(s): ' + ', '.join(unknown_handles)
+    known_leagues = set(p.get('league') for p in players if p.get('league'))
+    unknown_leagues = [league for league in constraints.get('league', {}) if league not in known_leagues]
+    if unknown_leagues:
+        return 'Unknown league(s): ' + ', '.join(unknown_leagues) + '. Known leagues: ' + ', '.join(
+            sorted(known_leagues))
+    included_players = list({p['player_id']: p for p in players if p.get('handle') in included_handles}.values())
+    if len(included_players) > 5:
+        return f'{len(included_players)} players are required but a team has only 5 slots'
+    # Required players must be able to take distinct roles
+    if included_players and not any(
+            all(role in player['roles'] or (role == 'Flex' and len(player['roles']) >= 2)
+                for player, role in zip(included_players, assignment))
+            for assignment in itertools.permutations(roles, len(included_players))):
+        return 'Required players cannot be assigned distinct roles: ' + ', '.join(
+            p['handle'] for p in included_players)
+    eligible_players = filter_players_by_constraints(players, constraints)
+    for role in roles:
+        if role == 'Flex':
+            has_candidate = any(len(p['roles']) >= 2 for p in eligible_players)
+        else:
+            has_candidate = any(role in p['roles'] for p in eligible_players)
+        if not has_candidate:
+            return f'No eligible player can play {role}'
+    # League constraints
+    league_requirements = constraints.get('league', {})
+    included_ids = set(p['player_id'] for p in included_players)
+    capacity = sum(1 for p in included_players if p.get('league') not in league_requirements)
+    min_total = 0
+    for league, req in league_requirements.items():
+        min_count = req.get('min', 0)
+        max_count = req.get('max', 5)
+        if min_count > max_count:
+            return f"League '{league}' requires at least {min_count} players but allows at most {max_count}"
+        required_count = sum(1 for p in included_players if p.get('league') == league)
+        available_count = len(set(p['player_id'] for p in eligible_players
+                                  if p.get('league') == league and p.get('roles')
+                                  and p['player_id'] not in included_ids))
+        if required_count > max_count:
+            return f"League '{league}' allows at most {max_count} players but {required_count} required players " \
+                   f"belong to it"
+        reachable_count = required_count + min(available_count, 5 - len(included_players))
+        if reachable_count < min_count:
+            return f"League '{league}' requires at least {min_count} players but at most {reachable_count} " \
+                   f"can be selected"
+        min_total += max(min_count, required_count)
+        capacity += min(max_count, required_count + available_count)
+    if min_total > 5:
+        return f'League constraints require at least {min_total} players but a team has only 5 slots'
+    if league_requirements and capacity < 5:
+        return f'League constraints allow at most {capacity} players but a team needs 5'
+    # Region diversity
+    if 'region' in constraints and 'diversity' in constraints['region']:
+        diversity = constraints['region']['diversity']
+        regions = set(p.get('current_region') for p in eligible_players if p.get('current_region'))
+        if diversity > len(regions):
+            return f'Region diversity {diversity} requires {diversity} regions but only {len(regions)} are ' \
+                   f'available'
+    return None
+
+
+def prune_candidate_pool(players, constraints, α=0.7, β=0.3):
+    # A player can be dropped when, for every role they can play, five other players from the same league and
+    # region score so much higher that swapping one of them in always raises the fitness: league, region and
+    # penalties stay the same and at most the nationality, past team and co-play chemistry of four pairs is lost
+    included_handles = set(constraints.get('player', []))
+    kept = set()
+    for role in ['Duelist', 'Initiator', 'Controller', 'Sentinel', 'Flex']:
+        buckets = {}
+        for index, player in enumerate(players):
+            if role in player['role_scores'] and (role != 'Flex' or len(player['roles']) >= 2):
+                buckets.setdefault((player.get('league'), player.get('current_region')), []).append(index)
+        for bucket in buckets.values():
+            bucket.sort(key=lambda i: players[i]['role_scores'][role], reverse=True)
+            # Best score of the first distinct player ids in the bucket; six are enough to find five others
+            top_scores = []
+            for index in bucket:
+                player = players[index]
+                score = player['role_scores'][role]
+                margin = β * 4 * (nationality_chemistry * bool(player.get('nationality'))
+                                  + past_team_chemistry * bool(roster_history.past_team_keys(player))
+                                  + coplay_chemistry * coplay_graph.has_teammates(player['player_id'])) / 10 / α
+                better = sum(1 for player_id, top_score in top_scores
+                             if player_id != player['player_id'] and top_score >= score + margin)
+                if better < 5:
+                    kept.add(index)
+                if len(top_scores) < 6 and all(player_id != player['player_id'] for player_id, _ in top_scores):
+                    top_scores.append((player['player_id'], score))
+    return [player for index, player in enumerate(players)
+            if index in kept or player.get('handle') in included_handles]
+
+
+def create_random_team(players, constraints, pools=None):
+    if pools is None:
+        pools = build_candidate_pools(players)
     team = []
     roles_needed = ['Duelist', 'Initiator', 'Controller', 'Sentinel', 'Flex']
     included_handles = constraints.get('player', [])
-    included_players = [p for p in players if p.get('handle') in included_handles]
+    included_players = [p for handle in included_handles for p in pools['by_handle'].get(handle, [])]
 
     # Ensure included players are unique
     included_player_ids = set()
@@ -170,20 +1113,12 @@ def create_random_team(players, constraints):
     # Remove assigned roles from roles_needed
     roles_needed = [role for role in roles_needed if role not in roles_assigned]
 
-    # Fill remaining roles
-    random.shuffle(players)
+    # Fill remaining roles with the best available player from each pre-sorted pool
     for role in roles_needed:
-        if role == 'Flex':
-            # For 'Flex', select players who can play multiple roles
-            eligible_players = [p for p in players if
-                                p['player_id'] not in assigned_player_ids and len(p['roles']) >= 2]
-        else:
-            eligible_players = [p for p in players if p['player_id'] not in assigned_player_ids and role in p['roles']]
-        if not eligible_players:
+        best_player = pick_best_candidate(pools, role, assigned_player_ids)
+        if not best_player:
             return None  # Cannot fill this role
-        # Select the best player based on role score
-        eligible_players.sort(key=lambda p: p['role_scores'].get(role, 0), reverse=True)
-        player = copy.deepcopy(eligible_players[0])
+        player = copy.deepcopy(best_player)
         player['assigned_role'] = role
         team.append(player)
         roles_assigned.append(role)
@@ -203,13 +1138,18 @@ def fitness_function(team, constraints, α=0.7, β=0.3, γ=1.0):
 
 
 def calculate_penalties(team, constraints):
-    penalties = 0
+    return sum(penalty_breakdown(team, constraints).values())
+
+
+def penalty_breakdown(team, constraints):
+    # Penalties by cause: missing roles and each kind of constraint
+    penalties = {'roles': 0, 'league': 0, 'region': 0, 'player': 0}
     # Check role constraints
     roles = [player['assigned_role'] for player in team]
     required_roles = ['Duelist', 'Initiator', 'Controller', 'Sentinel', 'Flex']
     for role in required_roles:
         if role not in roles:
-            penalties += 10  # Penalty for missing role
+            penalties['roles'] += missing_role_penalty  # Penalty for missing role
     # Check league constraints
     if 'league' in constraints:
         league_requirements = constraints['league']
@@ -222,23 +1162,193 @@ def calculate_penalties(team, constraints):
             max_count = req.get('max', 5)  # Default max to team size
             count = league_counts.get(league, 0)
             if count < min_count:
-                penalties += 25 * (min_count - count)
+                penalties['league'] += constraint_penalty * (min_count - count)
             if count > max_count:
-                penalties += 25 * (count - max_count)
+                penalties['league'] += constraint_penalty * (count - max_count)
     # Check region diversity constraints
     if 'region' in constraints and 'diversity' in constraints['region']:
         regions = set(player.get('current_region') for player in team if player.get('current_region'))
         if len(regions) < constraints['region']['diversity']:
-            penalties += 25 * (constraints['region']['diversity'] - len(regions))
+            penalties['region'] += constraint_penalty * (constraints['region']['diversity'] - len(regions))
     # Check included players
     included_handles = constraints.get('player', [])
     team_handles = [player.get('handle') for player in team]
     for handle in included_handles:
         if handle not in team_handles:
-            penalties += 25  # Penalty for missing required player
+            penalties['player'] += constraint_penalty  # Penalty for missing required player
     return penalties
 
 
+# Sets of taken roles (bitmasks over score_roles) by how many roles they hold, for best_role_assignment
+role_masks = [[mask for mask in range(2 ** len(score_roles)) if bin(mask).count('1') == taken]
+              for taken in range(len(score_roles) + 1)]
+
+
+def role_values(member, α=0.7, γ=1.0):
+    # α * role score for each role the member can play, -γ * missing role penalty for the others
+    return [α * member['role_scores'][role] if can_play(member, role) and role in member['role_scores']
+            else -γ * missing_role_penalty for role in score_roles]
+
+
+def best_role_assignment(members, fixed_roles=None, α=0.7, γ=1.0, values=None):
+    # Roles for five members that maximize α * role scores - γ * missing role penalties (chemistry and the other
+    # penalties do not depend on roles). A member placed in a role they cannot play leaves that role missing and
+    # gets None. fixed_roles[i], when set, pins member i to that role; values[i], when given, is role_values of
+    # member i. A DP over the roles already taken: rest[mask] is the best total of the remaining members once the
+    # first popcount(mask) members hold the roles in mask.
+    if values is None:
+        values = [role_values(member, α, γ) for member in members]
+    choices = [range(len(score_roles)) if not fixed_roles or fixed_roles[i] is None
+               else [score_roles.index(fixed_roles[i])] for i in range(len(members))]
+    rest = {2 ** len(score_roles) - 1: 0}
+    for i in range(len(members) - 1, -1, -1):
+        for mask in role_masks[i]:
+            totals = [values[i][role] + rest[mask | 1 << role] for role in choices[i]
+                      if not mask & 1 << role and mask | 1 << role in rest]
+            if totals:
+                rest[mask] = max(totals)
+    # Follow the optimum from the first member on, taking the first role that reaches it
+    roles = []
+    mask = 0
+    for member, member_values, member_choices in zip(members, values, choices):
+        role = next(role for role in member_choices if not mask & 1 << role and mask | 1 << role in rest
+                    and member_values[role] + rest[mask | 1 << role] == rest[mask])
+        mask |= 1 << role
+        playable = can_play(member, score_roles[role]) and score_roles[role] in member['role_scores']
+        roles.append(score_roles[role] if playable else None)
+    return roles
+
+
+def evaluate_lineup(members, fixed_roles, constraints, chemistry_cache, values_cache=None, α=0.7, β=0.3, γ=1.0):
+    # Fitness of a user-supplied lineup under its best role assignment, with the parts that make it up.
+    # chemistry_cache and values_cache keep pair chemistry and role_values across the lineups of one request, which
+    # mostly share players.
+    values = None
+    if values_cache is not None:
+        for member in members:
+            if id(member) not in values_cache:
+                values_cache[id(member)] = role_values(member, α, γ)
+        values = [values_cache[id(member)] for member in members]
+    roles = best_role_assignment(members, fixed_roles, α, γ, values)
+    team = [dict(member, assigned_role=role) for member, role in zip(members, roles)]
+    role_score = sum(member['role_scores'][role] for member, role in zip(members, roles) if role is not None)
+    total_chemistry = 0
+    for i in range(len(members)):
+        for j in range(i + 1, len(members)):
+            key = (id(members[i]), id(members[j]))
+            if key not in chemistry_cache:
+                chemistry_cache[key] = pair_chemistry(members[i], members[j])
+            total_chemistry += chemistry_cache[key]
+    chemistry_score = total_chemistry / 10 * 100
+    penalties = penalty_breakdown(team, constraints)
+    return {
+        'fitness': α * role_score + β * (chemistry_score / 100) - γ * sum(penalties.values()),
+        'role_score': role_score,
+        'chemistry_score': chemistry_score,
+        'penalties': penalties,
+        'assignment': [{'handle': member.get('handle'), 'player_id': member.get('player_id'), 'role': role}
+                       for member, role in zip(members, roles)]
+    }
+
+
+def team_key(team):
+    # Canonical (player, role) set: teams with the same players in the same roles have the same fitness
+    return frozenset((p['player_id'], p.get('handle'), p['assigned_role']) for p in team)
+
+
+def evaluate_team(team, constraints, α=0.7, β=0.3, γ=1.0):
+    # Fitness together with the running totals needed to re-score the team after a slot change
+    evaluation = {'members': [], 'score': 0, 'chemistry': 0, 'roles': {}, 'leagues': {}, 'regions': {}, 'handles': {}}
+    for player in team:
+        add_member(evaluation, player)
+    evaluation['fitness'] = evaluation_fitness(evaluation, constraints, α, β, γ)
+    return evaluation
+
+
+def add_member(evaluation, player):
+    evaluation['score'] += player['role_scores'][player['assigned_role']]
+    evaluation['chemistry'] += sum(pair_chemistry(player, other) for other in evaluation['members'])
+    evaluation['members'].append(player)
+    for counter, value in [('roles', player['assigned_role']), ('leagues', player.get('league')),
+                           ('regions', player.get('current_region')), ('handles', player.get('handle'))]:
+        evaluation[counter][value] = evaluation[counter].get(value, 0) + 1
+
+
+def remove_member(evaluation, player):
+    # Members are matched by player and role, a memoized evaluation may hold copies of the team's players
+    evaluation['members'] = [member for member in evaluation['members']
+                             if (member['player_id'], member.get('handle'), member['assigned_role'])
+                             != (player['player_id'], player.get('handle'), player['assigned_role'])]
+    evaluation['score'] -= player['role_scores'][player['assigned_role']]
+    evaluation['chemistry'] -= sum(pair_chemistry(player, other) for other in evaluation['members'])
+    for counter, value in [('roles', player['assigned_role']), ('leagues', player.get('league')),
+                           ('regions', player.get('current_region')), ('handles', player.get('handle'))]:
+        evaluation[counter][value] -= 1
+
+
+def replace_members(evaluation, removed, added, constraints, α=0.7, β=0.3, γ=1.0):
+    # Delta evaluation: only the pairs and counters touched by the changed slots are updated
+    evaluation = {'members': list(evaluation['members']), 'score': evaluation['score'],
+                  'chemistry': evaluation['chemistry'], 'roles': dict(evaluation['roles']),
+                  'leagues': dict(evaluation['leagues']), 'regions': dict(evaluation['regions']),
+                  'handles': dict(evaluation['handles'])}
+    for player in removed:
+        remove_member(evaluation, player)
+    for player in added:
+        add_member(evaluation, player)
+    evaluation['fitness'] = evaluation_fitness(evaluation, constraints, α, β, γ)
+    return evaluation
+
+
+def evaluation_fitness(evaluation, constraints, α=0.7, β=0.3, γ=1.0):
+    # Same value as fitness_function, computed from the running totals
+    team_size = len(evaluation['members'])
+    pair_count = team_size * (team_size - 1) // 2
+    chemistry_score = evaluation['chemistry'] / pair_count * 100 if pair_count > 0 else 0
+    return α * evaluation['score'] + β * (chemistry_score / 100) - γ * evaluation_penalties(evaluation, constraints)
+
+
+def evaluation_penalties(evaluation, constraints):
+    # Same value as calculate_penalties, computed from the running totals; 0 for a team that fills every role
+    # without breaking a constraint
+    penalties = 0
+    for role in ['Duelist', 'Initiator', 'Controller', 'Sentinel', 'Flex']:
+        if not evaluation['roles'].get(role):
+            penalties += missing_role_penalty
+    for league, req in constraints.get('league', {}).items():
+        count = evaluation['leagues'].get(league, 0)
+        if count < req.get('min', 0):
+            penalties += constraint_penalty * (req.get('min', 0) - count)
+        if count > req.get('max', 5):
+            penalties += constraint_penalty * (count - req.get('max', 5))
+    if 'region' in constraints and 'diversity' in constraints['region']:
+        region_count = sum(1 for region, count in evaluation['regions'].items() if region and count > 0)
+        if region_count < constraints['region']['diversity']:
+            penalties += constraint_penalty * (constraints['region']['diversity'] - region_count)
+    for handle in constraints.get('player', []):
+        if not evaluation['handles'].get(handle):
+            penalties += constraint_penalty
+    return penalties
+
+
+def evaluate_child(child, parent, parent_evaluation, constraints, fitness_memo):
+    # Look the child up by its (player, role) set, otherwise re-score it from the parent it differs from in a few
+    # slots; the memo is shared by the whole run because selection keeps re-creating the same teams
+    key = team_key(child)
+    evaluation = fitness_memo.get(key)
+    if evaluation is None:
+        parent_ids = set(map(id, parent))
+        child_ids = set(map(id, child))
+        removed = [p for p in parent if id(p) not in child_ids]
+        added = [p for p in child if id(p) not in parent_ids]
+        if len(removed) == len(added) <= 2:
+            evaluation = replace_members(parent_evaluation, removed, added, constraints)
+        else:
+            evaluation = evaluate_team(child, constraints)
+        fitness_memo[key] = evaluation
+    return evaluation
+
+
 def select_parents(population, fitnesses):
     total_fitness = sum(fitnesses)
     if total_fitness == 0:
@@ -277,85 +1387,1282 @@ def crossover(parent1, parent2):
     return child1, child2
 
 
-def mutate(team, players, constraints, mutation_rate=0.1):
+def mutate(team, players, constraints, mutation_rate=0.1, pools=None):
     if random.random() < mutation_rate:
+        if pools is None:
+            pools = build_candidate_pools(players)
         idx = random.randint(0, 4)
         role = team[idx]['assigned_role']
         assigned_player_ids = set(p['player_id'] for p in team)
-        if role == 'Flex':
-            # For 'Flex', select players who can play multiple roles
-            eligible_players = [p for p in players if
-                                p['player_id'] not in assigned_player_ids and len(p['roles']) >= 2]
-        else:
-            eligible_players = [p for p in players if p['player_id'] not in assigned_player_ids and role in p['roles']]
-        if eligible_players:
-            new_player = copy.deepcopy(random.choice(eligible_players))
+        new_player = pick_random_candidate(pools, role, assigned_player_ids)
+        if new_player:
+            new_player = copy.deepcopy(new_player)
             new_player['assigned_role'] = role
             team[idx] = new_player
     return team
 
 
-def genetic_algorithm(players, constraints, generations=50, population_size=50):
+def add_elite(elites, team, fitness, min_distance, sequence):
+    # Keep the elite heap min_distance players apart: a team is rejected when a fitter elite is too close to it,
+    # otherwise it replaces the weaker elites that are too close to it
+    player_ids = frozenset(p['player_id'] for p in team)
+    close = [elite for elite in elites if len(player_ids - elite[2]) < min_distance]
+    if any(elite[0] >= fitness for elite in close):
+        return False
+    if close:
+        elites[:] = [elite for elite in elites if len(player_ids - elite[2]) >= min_distance]
+        heapq.heapify(elites)
+    heapq.heappush(elites, (fitness, sequence, player_ids, team))
+    return True
+
+
+def update_elites(elites, elite_limit, teams, evaluations, constraints, min_distance, sequence):
+    # Offer every team that fills every role without breaking a constraint to the elite heap; returns the next
+    # sequence number
+    for team, evaluation in zip(teams, evaluations):
+        if (len(elites) < elite_limit or evaluation['fitness'] > elites[0][0]) and \
+                not evaluation_penalties(evaluation, constraints):
+            sequence += 1
+            if add_elite(elites, team, evaluation['fitness'], min_distance, sequence) and len(elites) > elite_limit:
+                heapq.heappop(elites)
+    return sequence
+
+
+def genetic_algorithm(players, constraints, generations=50, population_size=50, time_budget=None,
+                      stagnation_window=None, return_metadata=False, k=None, min_distance=1, timings=None):
+    # Anytime search: stops after `generations`, after time_budget seconds (checked after every pair of children)
+    # or once the best fitness has not improved for stagnation_window generations, and returns the best team found
+    # so far, the initial population included.
+    # With k set it returns up to k distinct teams instead, taken from a bounded heap of the best teams seen that
+    # fill every role without breaking a constraint, the initial population included; fewer when the search finds
+    # fewer such teams, and only the best team found when it finds none
+    start_time = time.perf_counter()
+    deadline = start_time + time_budget if time_budget is not None else None
+    metadata = {'generations_run': 0, 'stop_reason': 'generations', 'fitness_trajectory': []}
     population = generate_initial_population(players, constraints, population_size)
+    stage_start = record_stage(timings, 'generate_initial_population', start_time)
     if not population:
-        return None  # Cannot proceed without initial population
-    best_team = None
-    best_fitness = -math.inf
+        metadata['stop_reason'] = 'no_population'
+        best = None if k is None else []
+        return (best, metadata) if return_metadata else best  # Cannot proceed without initial population
+    pools = build_candidate_pools(players)
+    fitness_memo = {}
+    evaluations = [evaluate_team(team, constraints) for team in population]
+    initial_evaluation_count = evaluation_count = len(evaluations)
+    best_index = max(range(len(evaluations)), key=lambda i: evaluations[i]['fitness'])
+    best_team = population[best_index]
+    best_fitness = evaluations[best_index]['fitness']
+    last_improvement = 0
+    # Min-heap of (fitness, sequence, player ids, team) holding the best valid teams seen that are at least
+    # min_distance players apart
+    elites = []
+    elite_limit = max(50, 10 * (k or 0))
+    elite_sequence = 0
+    if k is not None:
+        elite_sequence = update_elites(elites, elite_limit, population, evaluations, constraints, min_distance,
+                                       elite_sequence)
     for generation in range(generations):
-        fitnesses = [fitness_function(team, constraints) for team in population]
+        fitnesses = [evaluation['fitness'] for evaluation in evaluations]
         new_population = []
+        new_evaluations = []
         for _ in range(population_size // 2):
-            parent1, parent2 = select_parents(population, fitnesses)
-            if parent1 is None or parent2 is None:
+            if deadline is not None and time.perf_counter() >= deadline:
+                metadata['stop_reason'] = 'time_budget'
+                break
+            # Select by index so each child can be re-scored from its parent's evaluation
+            index1, index2 = select_parents(range(len(population)), fitnesses)
+            if index1 is None or index2 is None:
                 continue  # Cannot select parents, skip
+            parent1, parent2 = population[index1], population[index2]
             child1, child2 = crossover(parent1, parent2)
-            child1 = mutate(child1, players, constraints)
-            child2 = mutate(child2, players, constraints)
+            child1 = mutate(child1, players, constraints, pools=pools)
+            child2 = mutate(child2, players, constraints, pools=pools)
             new_population.extend([child1, child2])
+            new_evaluations.append(evaluate_child(child1, parent1, evaluations[index1], constraints, fitness_memo))
+            new_evaluations.append(evaluate_child(child2, parent2, evaluations[index2], constraints, fitness_memo))
+        evaluation_count += len(new_evaluations)
         if not new_population:
+            if metadata['stop_reason'] != 'time_budget':
+                metadata['stop_reason'] = 'no_offspring'
             break  # Cannot generate new population, exit loop
         population = new_population
+        evaluations = new_evaluations
         # Update best team
-        for team in population:
-            fitness = fitness_function(team, constraints)
-            if fitness > best_fitness:
-                best_fitness = fitness
+        for team, evaluation in zip(population, evaluations):
+            if evaluation['fitness'] > best_fitness:
+                best_fitness = evaluation['fitness']
                 best_team = team
-    return best_team
+                last_improvement = generation
+        if k is not None:
+            elite_sequence = update_elites(elites, elite_limit, population, evaluations, constraints, min_distance,
+                                           elite_sequence)
+        metadata['generations_run'] = generation + 1
+        metadata['fitness_trajectory'].append(best_fitness)
+        if metadata['stop_reason'] == 'time_budget' or generation + 1 == generations:
+            break
+        if deadline is not None and time.perf_counter() >= deadline:
+            metadata['stop_reason'] = 'time_budget'
+            break
+        if stagnation_window is not None and generation - last_improvement >= stagnation_window:
+            metadata['stop_reason'] = 'stagnation'
+            break
+    metadata['elapsed_seconds'] = time.perf_counter() - start_time
+    if timings is not None:
+        record_stage(timings, 'generations', stage_start)
+        timings['generations_run'] = metadata['generations_run']
+        timings['evaluations'] = evaluation_count
+        timings['memo_hits'] = evaluation_count - initial_evaluation_count - len(fitness_memo)
+        timings['evaluations_per_second'] = evaluation_count / timings['generations'] \
+            if timings['generations'] > 0 else None
+    if k is not None:
+        best = [elite[3] for elite in heapq.nlargest(k, elites)] or [best_team]
+        return (best, metadata) if return_metadata else best
+    return (best_team, metadata) if return_metadata else best_team
+
+
+def build_player_positions(players):
+    return {(p['player_id'], p.get('handle')): position for position, p in enumerate(players)}
+
+
+def encode_team(team, positions):
+    # Compact team: a tuple of (player position, assigned role) pairs, cheap to copy and to send between processes
+    return tuple((positions[(p['player_id'], p.get('handle'))], p['assigned_role']) for p in team)
+
+
+def decode_team(compact_team, players):
+    return [dict(players[position], assigned_role=role) for position, role in compact_team]
+
+
+def crossover_compact(parent1, parent2, players):
+    # Same swap as crossover, keeping each slot in place
+    child1 = list(parent1)
+    child2 = list(parent2)
+    swap_indices = random.sample(range(5), 2)
+    for idx in swap_indices:
+        child1_ids = set(players[position]['player_id'] for position, _ in child1)
+        child2_ids = set(players[position]['player_id'] for position, _ in child2)
+        if players[parent2[idx][0]]['player_id'] not in child1_ids and \
+                players[parent1[idx][0]]['player_id'] not in child2_ids:
+            child1[idx] = parent2[idx]
+            child2[idx] = parent1[idx]
+    return tuple(child1), tuple(child2)
+
+
+def mutate_compact(team, players, pools, positions, mutation_rate=0.1):
+    if random.random() < mutation_rate:
+        idx = random.randint(0, 4)
+        role = team[idx][1]
+        assigned_player_ids = set(players[position]['player_id'] for position, _ in team)
+        new_player = pick_random_candidate(pools, role, assigned_player_ids)
+        if new_player:
+            new_slot = (positions[(new_player['player_id'], new_player.get('handle'))], role)
+            team = team[:idx] + (new_slot,) + team[idx + 1:]
+    return team
+
+
+# Per-process state shared by the islands evolved in this process
+island_context = {}
+
+
+def init_island_worker(players, constraints):
+    island_context['players'] = players
+    island_context['constraints'] = constraints
+    island_context['pools'] = build_candidate_pools(players)
+    island_context['positions'] = build_player_positions(players)
+    coplay_graph.load_coplay_graph()
+    roster_history.load_roster_history()
+
+
+def evolve_island(island):
+    # Run one island for island['generations'] generations, or until island['deadline'] (time.time(), comparable
+    # across processes); the island carries its own random state so results do not depend on which process evolves
+    # it. island['trajectory'] is the island's best fitness after each generation run.
+    players = island_context['players']
+    constraints = island_context['constraints']
+    pools = island_context['pools']
+    positions = island_context['positions']
+    deadline = island['deadline']
+    random.setstate(island['rng_state'])
+    population = island['population']
+    if population is None:
+        population = [encode_team(team, positions)
+                      for team in generate_initial_population(players, constraints, island['population_size'])]
+    population = population + island.get('migrants', [])
+    fitnesses = [fitness_function(decode_team(team, players), constraints) for team in population]
+    island['trajectory'] = []
+    for team, fitness in zip(population, fitnesses):
+        if fitness > island['best_fitness']:
+            island['best_fitness'] = fitness
+            island['best_team'] = team
+    for generation in range(island['generations']):
+        new_population = []
+        for _ in range(island['population_size'] // 2):
+            if deadline is not None and time.time() >= deadline:
+                break
+            parent1, parent2 = select_parents(population, fitnesses)
+            if parent1 is None or parent2 is None:
+                continue  # Cannot select parents, skip
+            child1, child2 = crossover_compact(parent1, parent2, players)
+            child1 = mutate_compact(child1, players, pools, positions)
+            child2 = mutate_compact(child2, players, pools, positions)
+            new_population.extend([child1, child2])
+        if not new_population:
+            break  # Cannot generate new population, exit loop
+        population = new_population
+        fitnesses = [fitness_function(decode_team(team, players), constraints) for team in population]
+        for team, fitness in zip(population, fitnesses):
+            if fitness > island['best_fitness']:
+                island['best_fitness'] = fitness
+                island['best_team'] = team
+        island['trajectory'].append(island['best_fitness'])
+        if deadline is not None and time.time() >= deadline:
+            break
+    island['population'] = population
+    island['fitnesses'] = fitnesses
+    island['migrants'] = []
+    island['rng_state'] = random.getstate()
+    return island
+
+
+def pipe_worker(connection, function, initializer, initargs):
+    initializer(*initargs)
+    while True:
+        item = connection.recv()
+        if item is None:
+            break
+        connection.send(function(item))
+    connection.close()
+
+
+def start_pipe_workers(count, function, initializer, initargs):
+    # Worker processes fed through pipes, for where multiprocessing.Pool cannot start: Lambda has no /dev/shm for
+    # the pool's semaphores, but plain processes and pipes work. Returns [(process, connection)].
+    workers = []
+    for _ in range(count):
+        connection, child_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=pipe_worker, daemon=True,
+                                          args=(child_connection, function, initializer, initargs))
+        process.start()
+        child_connection.close()
+        workers.append((process, connection))
+    return workers
+
+
+def pipe_map(workers, items):
+    # Results of the workers' function for every item, in item order. Each worker holds one item at a time, so a
+    # large result never waits on a full pipe while its worker is being sent the next item.
+    results = [None] * len(items)
+    pending = list(enumerate(items))[::-1]
+    busy = {}
+    for _, connection in workers:
+        if pending:
+            index, item = pending.pop()
+            connection.send(item)
+            busy[connection] = index
+    while busy:
+        for connection in multiprocessing.connection.wait(list(busy)):
+            results[busy.pop(connection)] = connection.recv()
+            if pending:
+                index, item = pending.pop()
+                connection.send(item)
+                busy[connection] = index
+    return results
+
+
+def stop_pipe_workers(workers):
+    for process, connection in workers:
+        try:
+            connection.send(None)
+        except OSError:
+            pass  # The worker has already exited
+        connection.close()
+    for process, _ in workers:
+        process.join()
+
+
+def island_genetic_algorithm(players, constraints, islands=None, generations=50, population_size=50,
+                             migration_interval=10, migration_size=2, seed=None, time_budget=None,
+                             stagnation_window=None, return_metadata=False):
+    # Island model: independent populations evolve in worker processes and every migration_interval generations
+    # each island sends its best migration_size teams to the next island in the ring. Stops like
+    # genetic_algorithm: after `generations`, after time_budget seconds (checked inside every island) or once the
+    # best fitness has not improved for stagnation_window generations (checked between migrations).
+    # Uses a process pool, or pipe-fed worker processes where no pool can start (Lambda), or evolves the islands
+    # one after another when neither is available.
+    start_time = time.perf_counter()
+    deadline = time.time() + time_budget if time_budget is not None else None
+    if islands is None:
+        islands = max(os.cpu_count() or 1, min_default_islands)
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    # Island i is seeded with seed + i, or with '<seed>-<i>' for a string seed
+    island_seeds = [seed + index if isinstance(seed, int) else f'{seed}-{index}' for index in range(islands)]
+    island_states = [{'index': index, 'population': None, 'population_size': population_size,
+                      'rng_state': random.Random(island_seeds[index]).getstate(), 'deadline': deadline,
+                      'best_team': None, 'best_fitness': -math.inf, 'migrants': []}
+                     for index in range(islands)]
+    metadata = {'generations_run': 0, 'stop_reason': 'generations', 'fitness_trajectory': [], 'islands': islands}
+    processes = min(islands, os.cpu_count() or 1)
+    pool = None
+    workers = None
+    if processes > 1 and not multiprocessing.current_process().daemon:  # Pool workers cannot start their own pool
+        try:
+            pool = multiprocessing.Pool(processes=processes, initializer=init_island_worker,
+                                        initargs=(players, constraints))
+        except OSError:
+            try:
+                workers = start_pipe_workers(processes, evolve_island, init_island_worker, (players, constraints))
+            except OSError:
+                workers = None  # No worker processes available, evolve the islands one after another
+    if pool is None and workers is None:
+        init_island_worker(players, constraints)
+    best_fitness = -math.inf
+    last_improvement = 0
+    try:
+        generations_run = 0
+        while generations_run < generations:
+            epoch = min(migration_interval, generations - generations_run)
+            for island in island_states:
+                island['generations'] = epoch
+            if pool is not None:
+                island_states = pool.map(evolve_island, island_states)
+            elif workers is not None:
+                island_states = pipe_map(workers, island_states)
+            else:
+                island_states = [evolve_island(island) for island in island_states]
+            # Best fitness across the islands after each generation of the epoch
+            trajectories = [island['trajectory'] for island in island_states if island['trajectory']]
+            epoch_run = max(map(len, trajectories), default=0)
+            for step in range(epoch_run):
+                fitness = max(trajectory[min(step, len(trajectory) - 1)] for trajectory in trajectories)
+                metadata['fitness_trajectory'].append(fitness)
+                if fitness > best_fitness:
+                    best_fitness = fitness
+                    last_improvement = generations_run + step
+            generations_run += epoch_run
+            metadata['generations_run'] = generations_run
+            timed_out = deadline is not None and time.time() >= deadline
+            if epoch_run < epoch and not timed_out:
+                metadata['stop_reason'] = 'no_offspring' if any(island['population'] for island in island_states) \
+                    else 'no_population'
+                break
+            if generations_run == generations:
+                break
+            if timed_out:
+                metadata['stop_reason'] = 'time_budget'
+                break
+            if stagnation_window is not None and generations_run - 1 - last_improvement >= stagnation_window:
+                metadata['stop_reason'] = 'stagnation'
+                break
+            if islands > 1:
+                # Ring migration: the best teams of each island replace the worst teams of the next one
+                for index, island in enumerate(island_states):
+                    ranked = sorted(range(len(island['population'])), key=lambda i: island['fitnesses'][i],
+                                    reverse=True)
+                    target = island_states[(index + 1) % islands]
+                    target['migrants'] = [island['population'][i] for i in ranked[:migration_size]]
+                for island in island_states:
+                    ranked = sorted(range(len(island['population'])), key=lambda i: island['fitnesses'][i])
+                    dropped = set(ranked[:len(island['migrants'])])
+                    island['population'] = [team for i, team in enumerate(island['population']) if i not in dropped]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if workers is not None:
+            stop_pipe_workers(workers)
+    metadata['elapsed_seconds'] = time.perf_counter() - start_time
+    # Global best across all islands
+    best_island = max(island_states, key=lambda island: island['best_fitness'])
+    best_team = decode_team(best_island['best_team'], players) if best_island['best_team'] is not None else None
+    return (best_team, metadata) if return_metadata else best_team
+
+
+def branch_and_bound_team(players, constraints, α=0.7, β=0.3, γ=1.0, node_limit=None, time_budget=None,
+                          return_metadata=False):
+    # Exact alternative to genetic_algorithm: depth-first search over the five role slots that returns the
+    # role-complete team with the highest fitness_function. A partial team is pruned when no completion can beat
+    # the best team found so far, using the best remaining role score per slot, exact chemistry with the players
+    # already chosen, the most chemistry open pairs could add and the cheapest constraint penalty still reachable.
+    # With node_limit or time_budget set, the search stops after that many nodes or seconds and returns the best
+    # team found, which is then no longer guaranteed to be optimal; the metadata says whether it is.
+    start_time = time.perf_counter()
+    deadline = start_time + time_budget if time_budget is not None else None
+    metadata = {'nodes': 0, 'optimal': False, 'stop_reason': 'no_team'}
+    eligible_players = filter_players_by_constraints(players, constraints)
+    if not eligible_players:
+        return (None, metadata) if return_metadata else None
+    pools = build_candidate_pools(eligible_players)
+    # Branch on the most constrained slots first
+    roles = sorted(pools['roles'], key=lambda role: len(pools['roles'][role]))
+    if any(not pools['roles'][role] for role in roles):
+        return (None, metadata) if return_metadata else None  # Some role cannot be filled at all
+    slot_count = len(roles)
+    total_pairs = slot_count * (slot_count - 1) // 2
+    pair_weight = β / total_pairs  # fitness per unit of pair chemistry
+    # Co-play chemistry of every eligible pair that played together, and the most any player gets from one pair
+    eligible_ids = {player['player_id'] for player in eligible_players}
+    coplay = {player_id: {other_id: coplay_chemistry * strength
+                          for other_id, strength in coplay_graph.player_teammates(player_id).items()
+                          if other_id in eligible_ids}
+              for player_id in eligible_ids}
+    coplay_reach = {player_id: max(strengths.values(), default=0) for player_id, strengths in coplay.items()}
+    # Same-region chemistry is bounded for the whole team below, the rest pair by pair
+    max_other_chemistry = max_pair_chemistry - region_chemistry - coplay_chemistry + max(coplay_reach.values(),
+                                                                                          default=0)
+
+    league_requirements = constraints.get('league', {})
+    leagues = list(league_requirements)
+    diversity = constraints['region'].get('diversity', 0) if 'region' in constraints else 0
+    required_handles = {}
+    for handle in constraints.get('player', []):
+        required_handles[handle] = required_handles.get(handle, 0) + 1
+    # Required players missing from the eligible pool are penalized whatever the team
+    unreachable_penalty = constraint_penalty * sum(
+        count for handle, count in required_handles.items() if handle not in pools['by_handle'])
+
+    league_indexes = {}
+    for player in eligible_players:
+        league_indexes[player['player_id']] = leagues.index(player['league']) \
+            if player.get('league') in league_requirements else None
+
+    def league_index(player):
+        return league_indexes[player['player_id']]
+
+    def plays(player, role):
+        return len(player['roles']) >= 2 if role == 'Flex' else role in player['roles']
+
+    # Candidates of every role bucketed by the attributes the penalties depend on, each bucket sorted by role score
+    buckets = {}
+    for role in roles:
+        buckets[role] = {}
+        for player in pools['roles'][role]:
+            key = (league_index(player), player.get('current_region') if diversity else None)
+            buckets[role].setdefault(key, []).append(player)
+
+    def penalty(league_counts, region_count, placed_handles):
+        penalties = unreachable_penalty
+        for league, count in zip(leagues, league_counts):
+            req = league_requirements[league]
+            penalties += constraint_penalty * max(0, req.get('min', 0) - count)
+            penalties += constraint_penalty * max(0, count - req.get('max', 5))
+        penalties += constraint_penalty * max(0, diversity - region_count)
+        for handle, count in required_handles.items():
+            if handle in pools['by_handle'] and handle not in placed_handles:
+                penalties += constraint_penalty * count
+        return penalties
+
+    state_penalties = {}
+
+    def state_penalty(state):
+        if state not in state_penalties:
+            state_penalties[state] = penalty(*state)
+        return state_penalties[state]
+
+    def region_pair_cap(region_count):
+        # Five players spread over n regions share a region in at most C(6 - n, 2) pairs
+        open_size = slot_count - max(region_count, 1) + 1
+        return open_size * (open_size - 1) // 2
+
+    # Nationality, region and past team names of every eligible player, so pair chemistry needs no rebuilding
+    signatures = {}
+    for player in eligible_players:
+        signatures[player['player_id']] = (player.get('nationality') or None, player.get('current_region') or None,
+                                           roster_history.past_team_keys(player))
+
+    def chemistry_with(player, team):
+        # Same as pair_chemistry summed over the team, split into same-region pairs and everything else
+        nationality, region, past_teams = signatures[player['player_id']]
+        teammates = coplay[player['player_id']]
+        total = 0
+        region_pairs = 0
+        for other in team:
+            other_nationality, other_region, other_past_teams = signatures[other['player_id']]
+            total += base_chemistry
+            if nationality and nationality == other_nationality:
+                total += nationality_chemistry
+            if region and region == other_region:
+                region_pairs += 1
+            if not past_teams.isdisjoint(other_past_teams):
+                total += past_team_chemistry
+            total += teammates.get(other['player_id'], 0)
+        return total, region_pairs
+
+    def label(player, regions, handles):
+        # What a candidate changes in the penalty: its constrained league, whether it adds a region, which
+        # missing required player it is
+        region = player.get('current_region')
+        handle = player.get('handle')
+        return (league_indexes[player['player_id']], bool(diversity and region and region not in regions),
+                handle if handle in required_handles and handle not in handles else None)
+
+    def slot_options(role, team, team_ids, regions, handles):
+        # Best role score plus non-region chemistry with the fixed players that a candidate of each label brings
+        options = {}
+        # Only nationality chemistry needs a match with a fixed player; count those matches up front
+        nationality_counts = {}
+        for player in team:
+            nationality = signatures[player['player_id']][0]
+            if nationality:
+                nationality_counts[nationality] = nationality_counts.get(nationality, 0) + 1
+        shared_ceiling = pair_weight * (base_chemistry + past_team_chemistry) * len(team)
+        other_ceiling = shared_ceiling + pair_weight * sum(coplay_reach[player['player_id']] for player in team)
+        ceiling = other_ceiling + pair_weight * nationality_chemistry * max(nationality_counts.values() or [0])
+        for (league, region), candidates in buckets[role].items():
+            best_value = -math.inf
+            for player in candidates:
+                if player['player_id'] in team_ids:
+                    continue
+                score = α * player['role_scores'].get(role, 0)
+                if score + ceiling <= best_value:
+                    break
+                teammates = coplay[player['player_id']]
+                if score + shared_ceiling + pair_weight * (
+                        nationality_chemistry * nationality_counts.get(signatures[player['player_id']][0], 0)
+                        + (sum(teammates.get(member['player_id'], 0) for member in team) if teammates else 0)) \
+                        <= best_value:
+                    continue
+                best_value = max(best_value, score + pair_weight * chemistry_with(player, team)[0])
+            if best_value > -math.inf:
+                key = (league, bool(region) and region not in regions, None)
+                options[key] = max(options.get(key, -math.inf), best_value)
+        for handle in required_handles:
+            if handle in handles:
+                continue
+            for player in pools['by_handle'].get(handle, []):
+                if player['player_id'] not in team_ids and plays(player, role):
+                    key = label(player, regions, handles)
+                    value = α * player['role_scores'].get(role, 0) + pair_weight * chemistry_with(player, team)[0]
+                    options[key] = max(options.get(key, -math.inf), value)
+        # A player from a new region may also be counted as adding none, which keeps the region count exact
+        for (league, adds_region, handle), value in list(options.items()):
+            if adds_region and value > options.get((league, False, handle), -math.inf):
+                options[(league, False, handle)] = value
+        return options
+
+    def add_label(state, key):
+        league_counts, region_count, placed_handles = state
+        league, adds_region, handle = key
+        if league is not None:
+            league_counts = league_counts[:league] + (league_counts[league] + 1,) + league_counts[league + 1:]
+        return league_counts, region_count + adds_region, placed_handles | {handle} if handle else placed_handles
+
+    def completions(state, option_sets):
+        # Best slot value total for every reachable penalty state; distinct slots may count the same
+        # player here, which only makes the bound more optimistic
+        states = {state: 0}
+        for options in option_sets:
+            next_states = {}
+            for current, value in states.items():
+                for key, option_value in options.items():
+                    reached = add_label(current, key)
+                    if value + option_value > next_states.get(reached, -math.inf):
+                        next_states[reached] = value + option_value
+            states = next_states
+        return states
+
+    def team_value(members):
+        team = [player for _, player in members]
+        score_total = sum(player['role_scores'].get(role, 0) for role, player in members)
+        chemistry_total = 0
+        for i in range(len(team)):
+            chemistry, shared_regions = chemistry_with(team[i], team[:i])
+            chemistry_total += chemistry + region_chemistry * shared_regions
+        league_counts = [0] * len(leagues)
+        for player in team:
+            if league_index(player) is not None:
+                league_counts[league_index(player)] += 1
+        regions = set(player['current_region'] for player in team if player.get('current_region'))
+        handles = set(player.get('handle') for player in team)
+        return α * score_total + pair_weight * chemistry_total - γ * penalty(league_counts, len(regions), handles)
+
+    # Seed the incumbent with the greedy team improved by single-slot swaps, so pruning is tight from the start
+    members = []
+    assigned_player_ids = set()
+    for role in roles:
+        player = pick_best_candidate(pools, role, assigned_player_ids)
+        if not player:
+            return (None, metadata) if return_metadata else None  # Not enough distinct players to fill every role
+        members.append((role, player))
+        assigned_player_ids.add(player['player_id'])
+    best = {'fitness': team_value(members), 'team': members, 'nodes': 0, 'stop_reason': None}
+    improved = True
+    while improved and (deadline is None or time.perf_counter() < deadline):
+        improved = False
+        for idx, role in enumerate(roles):
+            team_ids = set(player['player_id'] for _, player in best['team'])
+            for player in pools['roles'][role]:
+                if player['player_id'] in team_ids:
+                    continue
+                candidate = list(best['team'])
+                candidate[idx] = (role, player)
+                fitness = team_value(candidate)
+                if fitness > best['fitness']:
+                    best['fitness'] = fitness
+                    best['team'] = candidate
+                    improved = True
+                    break
+
+    team = []
+    team_ids = set()
+    region_counts = {}
+    handle_counts = {}
+
+    def search(depth, score_total, chemistry_total, region_pairs, league_counts):
+        if best['stop_reason'] is not None:
+            return
+        if node_limit is not None and best['nodes'] >= node_limit:
+            best['stop_reason'] = 'node_limit'
+            return
+        if deadline is not None and time.perf_counter() >= deadline:
+            best['stop_reason'] = 'time_budget'
+            return
+        best['nodes'] += 1
+        open_slots = slot_count - depth
+        fixed_value = α * score_total + pair_weight * chemistry_total
+        if not open_slots:
+            fitness = fixed_value + pair_weight * region_chemistry * region_pairs \
+                - γ * penalty(league_counts, len(region_counts), handle_counts)
+            if fitness > best['fitness']:
+                best['fitness'] = fitness
+                best['team'] = list(zip(roles, team))
+            return
+        option_sets = [slot_options(role, team, team_ids, region_counts, handle_counts) for role in roles[depth:]]
+        state = (league_counts, len(region_counts),
+                 frozenset(handle for handle in handle_counts if handle in required_handles))
+        # Pairs involving an open slot can still turn out to share a region
+        region_pairs_ceiling = region_pairs + total_pairs - depth * (depth - 1) // 2
+        rest = completions(state, option_sets[1:])
+        rest_values = {}
+        for key in option_sets[0]:
+            reached = []
+            for current, value in rest.items():
+                reached_state = add_label(current, key)
+                reached.append(value - γ * state_penalty(reached_state)
+                               + pair_weight * region_chemistry * min(region_pairs_ceiling,
+                                                                      region_pair_cap(reached_state[1])))
+            rest_values[key] = max(reached) if reached else -math.inf
+        # Pairs among players not yet chosen can add at most max_other_chemistry each outside their region
+        base_value = fixed_value + pair_weight * max_other_chemistry * (open_slots * (open_slots - 1) // 2)
+        node_bound = max([option_sets[0][key] + rest_values[key] for key in option_sets[0]] or [-math.inf])
+        if base_value + node_bound <= best['fitness']:
+            return
+        best_rest = max(rest_values.values())
+        chemistry_ceiling = pair_weight * max_other_chemistry * depth
+        role = roles[depth]
+        children = []
+        for player in pools['roles'][role]:
+            if player['player_id'] in team_ids:
+                continue
+            score = α * player['role_scores'].get(role, 0)
+            if score + chemistry_ceiling + best_rest + base_value <= best['fitness']:
+                break  # Candidates are sorted by role score, so no later one can do better
+            chemistry, shared_regions = chemistry_with(player, team)
+            league, adds_region, handle = label(player, region_counts, handle_counts)
+            rest_value = max(rest_values.get((league, adds_region, handle), -math.inf),
+                             rest_values.get((league, False, handle), -math.inf))
+            bound = score + pair_weight * chemistry + rest_value + base_value
+            if bound > best['fitness']:
+                children.append((bound, chemistry, shared_regions, player))
+        # Most promising candidates first, so good teams are found early and prune the rest
+        children.sort(key=lambda child: child[0], reverse=True)
+        for bound, chemistry, shared_regions, player in children:
+            if bound <= best['fitness']:
+                break
+            league = league_index(player)
+            region = player.get('current_region')
+            handle = player.get('handle')
+            team.append(player)
+            team_ids.add(player['player_id'])
+            if region:
+                region_counts[region] = region_counts.get(region, 0) + 1
+            handle_counts[handle] = handle_counts.get(handle, 0) + 1
+            search(depth + 1, score_total + player['role_scores'].get(role, 0), chemistry_total + chemistry,
+                   region_pairs + shared_regions,
+                   league_counts if league is None else
+                   league_counts[:league] + (league_counts[league] + 1,) + league_counts[league + 1:])
+            team.pop()
+            team_ids.discard(player['player_id'])
+            if region:
+                region_counts[region] -= 1
+                if not region_counts[region]:
+                    del region_counts[region]
+            handle_counts[handle] -= 1
+            if not handle_counts[handle]:
+                del handle_counts[handle]
+
+    search(0, 0, 0, 0, (0,) * len(leagues))
+    best_team = []
+    for role, player in best['team']:
+        player = copy.deepcopy(player)
+        player['assigned_role'] = role
+        best_team.append(player)
+    metadata = {'nodes': best['nodes'], 'optimal': best['stop_reason'] is None,
+                'stop_reason': best['stop_reason'] or 'complete', 'elapsed_seconds': time.perf_counter() - start_time}
+    return (best_team, metadata) if return_metadata else best_team
+
+
+def response_fields(event):
+    # Player fields to return: the compact set, the requested `fields` projection, or everything (None)
+    if event.get('compact'):
+        return compact_fields
+    return event.get('fields')
 
 
-def construct_output(team):
+def construct_output(team, fields=None):
     output = {}
+    # Cold fields are only read when the projection needs them
+    if fields is None or any(field not in player for player in team for field in fields):
+        team = load_cold_fields(team)
     for player in team:
         role = player['assigned_role']
+        if fields is not None:
+            player = {field: player[field] for field in fields if field in player}
         output[role] = player
     chemistry_score = calculate_chemistry(team)
     output['chemistry_score'] = round(chemistry_score)
     return output
 
 
+# perf_counter deadline of the current Lambda invocation, from its context; None outside Lambda
+invocation = {'deadline': None}
+
+
 def lambda_handler(event, context):
-    # Load constraints from the event
-    constraints = event.get('constraints', {})
-    # Load preprocessed player data
-    players = load_preprocessed_data()
-    players = normalize_player_stats(players)
-    players = calculate_player_scores(players)
-    # Run genetic algorithm to find the best team
-    best_team = genetic_algorithm(players, constraints)
+    request_start = time.perf_counter()
+    remaining_millis = getattr(context, 'get_remaining_time_in_millis', None)
+    invocation['deadline'] = request_start + remaining_millis() / 1000 if remaining_millis else None
+    try:
+        result_cache.data_version(active_data_path(player_data_file))
+    except OSError:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': f'Player data is not available: {player_data_file} was not found.'})
+        }
+    if 'batch' in event:
+        response = batch_response(event['batch'])
+    elif 'suggest' in event:
+        response = suggest_response(event)
+    elif 'similar' in event:
+        response = similar_response(event)
+    elif 'evaluate' in event:
+        response = evaluate_response(event)
+    elif 'teammates' in event:
+        response = teammates_response(event)
+    else:
+        response = team_response(event, request_start=request_start)
+    return compress_response(response, event.get('headers'))
+
+
+def suggest_response(event, players=None):
+    # Handle suggestions for a partial or misspelled handle
+    query = event.get('suggest')
+    limit = event.get('limit', default_suggestion_limit)
+    if not isinstance(query, str) or not query.strip():
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'suggest must be a non-empty handle.'})
+        }
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'limit must be a positive integer.'})
+        }
+    if players is None:
+        players = get_player_data()
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'query': query, 'suggestions': suggest_handles(players, query.strip(), limit)})
+    }
+
+
+def similar_response(event, players=None):
+    # Players most similar to a given one, e.g. replacements for a lineup slot
+    k = event.get('k', default_suggestion_limit)
+    role = event.get('role')
+    error = None
+    if not isinstance(event.get('similar'), str) or not event['similar'].strip():
+        error = 'similar must be a non-empty handle.'
+    elif not isinstance(k, int) or isinstance(k, bool) or k < 1:
+        error = 'k must be a positive integer.'
+    elif role is not None and role not in score_roles:
+        error = f"role must be one of {', '.join(score_roles)}."
+    elif any(not isinstance(event.get(field, []), list) for field in ['league', 'region', 'exclude']):
+        error = 'league, region and exclude must be lists.'
+    if error is None:
+        if players is None:
+            players = get_player_data()
+        constraints, error = resolve_constraint_handles(players, {'player': [event['similar'].strip()]})
+    if error:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': error})
+        }
+    target = get_handle_index(players)['exact'][constraints['player'][0]][0]
+    leagues = set(event['league']) if 'league' in event else None
+    regions = set(event['region']) if 'region' in event else None
+    matches = similar_players(players, target, k, leagues, regions, role, event.get('exclude', []))
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'player': {field: target.get(field) for field in similarity_fields},
+                            'similar': [dict({field: player.get(field) for field in similarity_fields},
+                                             distance=round(distance, 4)) for distance, player in matches]})
+    }
+
+
+def teammates_response(event, players=None):
+    # Whether two players were ever on the same team, and when, from the roster history
+    handles = event.get('teammates')
+    error = None
+    if not isinstance(handles, list) or len(handles) != 2 or \
+            not all(isinstance(handle, str) and handle.strip() for handle in handles):
+        error = 'teammates must be a list of two handles.'
+    elif roster_history.load_roster_history() is None:
+        error = 'Roster history is not available: none has been built.'
+    if error is None:
+        if players is None:
+            players = get_player_data()
+        constraints, error = resolve_constraint_handles(players, {'player': [handle.strip() for handle in handles]})
+    if error:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': error})
+        }
+    index = get_handle_index(players)
+    pair = [index['exact'][handle][0] for handle in constraints['player']]
+    if pair[0].get('player_id') == pair[1].get('player_id'):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'teammates must name two different players.'})
+        }
+    periods = roster_history.teammate_periods(pair[0].get('player_id'), pair[1].get('player_id'))
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'players': [{'handle': player.get('handle'), 'player_id': player.get('player_id')}
+                                        for player in pair],
+                            'teammates': bool(periods), 'periods': periods})
+    }
+
+
+def parse_lineup(lineup, players, resolved):
+    # Members and pinned roles of a lineup given as five handles or {'handle', 'role'} objects, or an error.
+    # resolved caches handle resolutions across the lineups of a request.
+    if not isinstance(lineup, list) or len(lineup) != 5:
+        return None, None, 'A lineup must list five players.'
+    members = []
+    fixed_roles = []
+    for entry in lineup:
+        handle, role = (entry.get('handle'), entry.get('role')) if isinstance(entry, dict) else (entry, None)
+        if not isinstance(handle, str):
+            return None, None, 'Each lineup entry must be a handle or an object with a handle.'
+        if role is not None and role not in score_roles:
+            return None, None, f'Unknown role {role} for {handle}.'
+        if handle not in resolved:
+            resolved[handle] = resolve_constraint_handles(players, {'player': [handle]})
+        constraints, error = resolved[handle]
+        if error:
+            return None, None, error
+        members.append(get_handle_index(players)['exact'][constraints['player'][0]][0])
+        fixed_roles.append(role)
+    if len(set(member.get('player_id') for member in members)) < len(members):
+        return None, None, 'A lineup cannot list the same player twice.'
+    pinned = [role for role in fixed_roles if role is not None]
+    if len(set(pinned)) < len(pinned):
+        return None, None, 'Two players are pinned to the same role.'
+    return members, fixed_roles, None
+
+
+def evaluate_response(event, players=None):
+    # Score user-supplied lineups under the request's constraints. Results come back in request order, each with
+    # its fitness breakdown and best role assignment, or its own error.
+    lineups = event.get('evaluate')
+    if not isinstance(lineups, list) or not lineups or len(lineups) > max_evaluate_lineups:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': f'evaluate must be a list of 1 to {max_evaluate_lineups} lineups.'})
+        }
+    if players is None:
+        players = get_player_data()
+    coplay_graph.load_coplay_graph()
+    roster_history.load_roster_history()
+    constraints, error = normalize_constraints(event.get('constraints', {}))
+    if error is None:
+        constraints, error = resolve_constraint_handles(players, constraints)
+    profiled = None
+    if error is None:
+        profiled, error = rescore_for_request(players, event, constraints)
+    if error:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': error})
+        }
+    if profiled is players:
+        profiled = None
+    rows = {id(player): row for row, player in enumerate(players)} if profiled is not None else None
+    resolved = {}
+    chemistry_cache = {}
+    values_cache = {}
+    results = []
+    for lineup in lineups:
+        members, fixed_roles, error = parse_lineup(lineup, players, resolved)
+        if error:
+            results.append({'error': error})
+            continue
+        if profiled is not None:
+            members = [profiled[rows[id(member)]] for member in members]
+        results.append(evaluate_lineup(members, fixed_roles, constraints, chemistry_cache, values_cache))
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'results': results})
+    }
+
+
+def accepts_gzip(headers):
+    accept_encoding = {name.lower(): value for name, value in (headers or {}).items()}.get('accept-encoding', '')
+    return 'gzip' in accept_encoding.lower()
+
+
+def compress_response(response, headers):
+    # Gzip the body for clients that send Accept-Encoding: gzip; API Gateway expects binary bodies base64 encoded
+    if not accepts_gzip(headers) or len(response['body']) < gzip_min_bytes:
+        return response
+    body = gzip.compress(response['body'].encode('utf-8'))
+    return dict(response, body=base64.b64encode(body).decode('ascii'), isBase64Encoded=True,
+                headers=dict(response.get('headers', {}), **{'Content-Type': 'application/json',
+                                                              'Content-Encoding': 'gzip'}))
+
+
+def request_cache_key(event, constraints):
+    # 'deterministic' (default) seeds the search and serves repeated requests from the result cache,
+    # 'fresh' runs a new randomized search every time; returns the cache key (None when fresh) and the seed
+    if event.get('cache_mode') == 'fresh':
+        return None, event.get('seed')
+    seed = event.get('seed', default_seed)
+    if event.get('debug') or event.get('profile'):
+        return None, seed  # Timings and profiles describe a real search, never a cache hit
+    options = {option: event.get(option)
+               for option in ['engine', 'islands', 'time_budget', 'stagnation_window', 'k', 'min_distance', 'fields',
+                              'compact', 'weight_profile']}
+    if normalization_method != 'max':
+        options['normalization'] = normalization_method
+    try:
+        version = result_cache.data_version(active_data_path(player_data_file))
+    except OSError:
+        return None, seed  # No player data file to version the results by
+    if stat_index.get('version'):
+        options['roster_version'] = stat_index['version']  # Upserted players change the results
+    if event.get('weight_profile') is not None:
+        load_weight_profiles()
+        options['weight_profiles_version'] = weight_profiles['version']  # Edited profiles invalidate cached teams
+    if stat_cube.load_stat_cube() is not None:
+        options['stat_cube_version'] = stat_cube.loaded_cube['version']  # New games change the form and map weights
+    if coplay_graph.load_coplay_graph() is not None:
+        options['coplay_graph_version'] = coplay_graph.loaded_graph['version']  # New games change the chemistry
+    if roster_history.load_roster_history() is not None:
+        options['roster_history_version'] = roster_history.loaded_history['version']
+    if ratings.load_ratings() is not None:
+        options['ratings_version'] = ratings.loaded_ratings['version']  # New matches change the rating strengths
+    return result_cache.cache_key(constraints, version, seed, options), seed
+
+
+def team_response(event, players=None, request_start=None):
+    # Load constraints from the event; request_start is when the invocation started, which time_budget counts from
+    constraints, error = normalize_constraints(event.get('constraints', {}))
+    if error:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': error})
+        }
+    key, seed = request_cache_key(event, constraints)
+    if event.get('profile'):
+        return profile_team_response(event, constraints, seed, players, request_start)
+    if key is None:
+        return generate_team_response(event, constraints, seed, players, request_start)
+    response = result_cache.cache_get(key)
+    if response is None:
+        response = generate_team_response(event, constraints, seed, players, request_start)
+        if response['statusCode'] == 200:
+            result_cache.cache_put(key, response)  # Errors are cheap to answer again and may not last
+    return dict(response)
+
+
+# Per-process player data shared by the batch items run in this process
+batch_context = {}
+
+
+def init_batch_worker(players, index=None):
+    # index is the parent's stat_index, so workers can apply upserts to their copy of the roster
+    batch_context['players'] = players
+    batch_context['applied_updates'] = 0
+    if index is not None:
+        index = dict(index)  # A forked worker gets this module's own stat_index as index
+        stat_index.clear()
+        stat_index.update(index)
+
+
+def apply_roster_updates(updates):
+    # Upserts accepted since this worker started, in order; each is applied once
+    for update in updates[batch_context['applied_updates']:]:
+        upsert_players(batch_context['players'], update)
+    batch_context['applied_updates'] = len(updates)
+
+
+def run_batch_item(item):
+    # (event, constraints, seed), optionally followed by the roster upserts the worker must apply first
+    event, constraints, seed = item[:3]
+    try:
+        if len(item) > 3:
+            apply_roster_updates(item[3])
+        if event.get('profile'):
+            return profile_team_response(event, constraints, seed, batch_context['players'])
+        return generate_team_response(event, constraints, seed, batch_context['players'])
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': f'Team generation failed: {e}'})
+        }
+
+
+def run_evaluate_item(item):
+    # (event, roster upserts) for a server worker
+    event, updates = item
+    apply_roster_updates(updates)
+    return evaluate_response(event, batch_context['players'])
+
+
+def batch_response(items, workers=None):
+    # Run a list of team requests against one copy of the player data, in parallel across a process pool, or
+    # across pipe-fed worker processes where no pool can start (Lambda).
+    # Results come back in request order, each with its own status code.
+    if not isinstance(items, list):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'batch must be a list of team requests.'})
+        }
+    responses = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            responses[index] = {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Each batch item must be a team request object.'})
+            }
+            continue
+        constraints, error = normalize_constraints(item.get('constraints', {}))
+        if error:
+            responses[index] = {
+                'statusCode': 400,
+                'body': json.dumps({'error': error})
+            }
+            continue
+        key, seed = request_cache_key(item, constraints)
+        cached = result_cache.cache_get(key) if key is not None else None
+        if cached is not None:
+            responses[index] = cached
+        else:
+            pending.append((index, key, (item, constraints, seed)))
+    if pending:
+        players = get_player_data()
+        if workers is None:
+            workers = min(len(pending), os.cpu_count() or 1)
+        pool = None
+        pipe_workers = None
+        if workers > 1:
+            try:
+                pool = multiprocessing.Pool(processes=workers, initializer=init_batch_worker,
+                                            initargs=(players, stat_index))
+            except OSError:
+                try:
+                    pipe_workers = start_pipe_workers(workers, run_batch_item, init_batch_worker, (players, stat_index))
+                except OSError:
+                    pipe_workers = None  # No worker processes available, run the items one after another
+        if pool is not None:
+            try:
+                results = pool.map(run_batch_item, [work for _, _, work in pending])
+            finally:
+                pool.close()
+                pool.join()
+        elif pipe_workers is not None:
+            try:
+                results = pipe_map(pipe_workers, [work for _, _, work in pending])
+            finally:
+                stop_pipe_workers(pipe_workers)
+        else:
+            init_batch_worker(players)
+            results = [run_batch_item(work) for _, _, work in pending]
+        for (index, key, _), response in zip(pending, results):
+            if key is not None and response['statusCode'] == 200:
+                result_cache.cache_put(key, response)
+            responses[index] = response
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'results': [{'statusCode': response['statusCode'], 'body': json.loads(response['body'])}
+                                        for response in responses]})
+    }
+
+
+def profile_team_response(event, constraints, seed, players=None, request_start=None):
+    # Opt-in cProfile run of a single request; the stats file is written to profile_dir and its path logged
+    profiler = cProfile.Profile()
+    response = profiler.runcall(generate_team_response, event, constraints, seed, players, request_start)
+    profile_path = os.path.join(profile_dir, f'team-profile-{time.time_ns()}.prof')
+    profiler.dump_stats(profile_path)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(15)
+    logger.info(json.dumps({'event': 'team_profile', 'profile_path': profile_path, 'top': summary.getvalue()}))
+    return response
+
+
+def check_request_options(event):
+    # Returns an error message for malformed search or response options, None when they can be used
+    time_budget = event.get('time_budget')
+    stagnation_window = event.get('stagnation_window')
+    seed = event.get('seed')
+    if seed is not None and (not isinstance(seed, (int, str)) or isinstance(seed, bool)):
+        return 'seed must be an integer or a string.'
+    if time_budget is not None and (not isinstance(time_budget, (int, float)) or isinstance(time_budget, bool)
+                                    or time_budget <= 0):
+        return 'time_budget must be a positive number of seconds.'
+    if stagnation_window is not None and (not isinstance(stagnation_window, int) or isinstance(stagnation_window, bool)
+                                          or stagnation_window < 1):
+        return 'stagnation_window must be a positive integer.'
+    for option, maximum in [('k', 50), ('min_distance', 5), ('islands', 64)]:
+        value = event.get(option)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= maximum):
+            return f'{option} must be an integer from 1 to {maximum}.'
+    engine = event.get('engine') if event.get('engine') in ('island', 'exact') else 'genetic'
+    for option, engines in [('k', ['genetic']), ('min_distance', ['genetic']), ('islands', ['island']),
+                            ('stagnation_window', ['genetic', 'island'])]:
+        if event.get(option) is not None and engine not in engines:
+            return f"{option} is not supported by the '{engine}' engine."
+    fields = event.get('fields')
+    if fields is not None:
+        if not isinstance(fields, list) or not fields or not all(isinstance(field, str) for field in fields):
+            return 'fields must be a non-empty list of player field names.'
+        unknown_fields = [field for field in fields if field not in player_fields]
+        if unknown_fields:
+            return 'Unknown player field(s): ' + ', '.join(unknown_fields)
+    return None
+
+
+def generate_team_response(event, constraints, seed, players=None, request_start=None):
+    # Per-stage durations; returned as `timings` with the debug flag and always logged. time_budget counts from
+    # request_start, the start of the invocation when given, so loading, scoring and pruning use part of it.
+    timings = {}
+    if request_start is None:
+        request_start = time.perf_counter()
+    error = check_request_options(event)
+    if error:
+        log_timings(event, 400, timings, request_start)
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': error})
+        }
+    if players is None:
+        players = get_player_data(timings)
+    # Pair chemistry reads the co-play graph and roster history current at the start of the request
+    coplay_graph.load_coplay_graph()
+    roster_history.load_roster_history()
+    stage_start = time.perf_counter()
+    constraints, error = resolve_constraint_handles(players, constraints)
+    record_stage(timings, 'resolve_constraint_handles', stage_start)
+    if error:
+        log_timings(event, 400, timings, request_start)
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': error})
+        }
+    if event.get('weight_profile') is not None or constraints.get('maps') is not None:
+        stage_start = time.perf_counter()
+        players, error = rescore_for_request(players, event, constraints)
+        record_stage(timings, 'apply_map_weights' if constraints.get('maps') is not None else 'apply_weight_profile',
+                     stage_start)
+        if error:
+            log_timings(event, 400, timings, request_start)
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': error})
+            }
+    # Reject infeasible constraints before searching, then search only players that can be in an optimal team
+    stage_start = time.perf_counter()
+    error = check_constraints_feasibility(players, constraints)
+    stage_start = record_stage(timings, 'check_constraints_feasibility', stage_start)
+    if error:
+        log_timings(event, 400, timings, request_start)
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': error})
+        }
+    players = prune_candidate_pool(players, constraints)
+    stage_start = record_stage(timings, 'prune_candidate_pool', stage_start)
+    # Find the best team with the requested search engine, in what is left of the time budget
+    search_metadata = None
+    teams = None
+    time_budget = search_time_budget(event, request_start)
+    if seed is not None:
+        random.seed(seed)
+    if event.get('engine') == 'exact':
+        best_team, search_metadata = branch_and_bound_team(players, constraints, node_limit=exact_node_limit,
+                                                           time_budget=time_budget, return_metadata=True)
+        stage_start = record_stage(timings, 'branch_and_bound_team', stage_start)
+    elif event.get('engine') == 'island':
+        best_team, search_metadata = island_genetic_algorithm(players, constraints, islands=event.get('islands'),
+                                                              seed=seed, time_budget=time_budget,
+                                                              stagnation_window=event.get('stagnation_window'),
+                                                              return_metadata=True)
+        stage_start = record_stage(timings, 'island_genetic_algorithm', stage_start)
+    else:
+        best_team, search_metadata = genetic_algorithm(players, constraints, time_budget=time_budget,
+                                                       stagnation_window=event.get('stagnation_window'),
+                                                       return_metadata=True, k=event.get('k'),
+                                                       min_distance=event.get('min_distance') or 1,
+                                                       timings=timings)
+        stage_start = time.perf_counter()
+        if event.get('k') is not None:
+            teams = best_team
+            best_team = teams[0] if teams else None
     if best_team:
-        output = construct_output(best_team)
+        fields = response_fields(event)
+        output = construct_output(best_team, fields)
+        if event.get('k') is not None:
+            output['teams'] = [construct_output(team, fields) for team in teams]
+        if search_metadata:
+            output['search'] = search_metadata
+        record_stage(timings, 'construct_output', stage_start)
+        log_timings(event, 200, timings, request_start)
+        if event.get('debug'):
+            output['timings'] = timings
         return {
             'statusCode': 200,
             'body': json.dumps(output)
         }
     else:
+        log_timings(event, 400, timings, request_start)
         return {
             'statusCode': 400,
             'body': json.dumps({'error': 'Could not find a suitable team with the given constraints.'})
         }
 
 
+def search_time_budget(event, request_start):
+    # Seconds left for the search: the request's time_budget, by default exact_time_budget for the exact engine,
+    # counted from request_start and capped at lambda_time_share of the time the invocation had left; None when
+    # the search is unbounded
+    budget = event.get('time_budget')
+    if budget is None and event.get('engine') == 'exact':
+        budget = exact_time_budget
+    deadlines = [request_start + budget] if budget is not None else []
+    if invocation['deadline'] is not None:
+        deadlines.append(request_start + lambda_time_share * (invocation['deadline'] - request_start))
+    return max(min(deadlines) - time.perf_counter(), 0) if deadlines else None
+
+
+def log_timings(event, status_code, timings, request_start):
+    timings['total'] = time.perf_counter() - request_start
+    logger.info(json.dumps({'event': 'team_timings', 'engine': event.get('engine', 'genetic'),
+                            'status_code': status_code, 'timings': timings}))
+
+
 # For local testing
 if __name__ == '__main__':
     # Example constraints
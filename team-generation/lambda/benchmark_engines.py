@@ -0,0 +1,85 @@
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+
+# Compare latency and fitness of the genetic algorithm and the exact branch-and-bound solver
+# Usage: python benchmark_engines.py [preprocessed_players.json] [ga_runs]
+
+module_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '2.generate.py')
+spec = importlib.util.spec_from_file_location('generate', module_path)
+generate = importlib.util.module_from_spec(spec)
+sys.modules['generate'] = generate
+spec.loader.exec_module(generate)
+
+# Constraint sets to benchmark, from unconstrained to restrictive
+benchmark_cases = {
+    'unconstrained': {},
+    'api example': {
+        'league': {'vct-international': {'min': 5, 'max': 5}},
+        'region': {'diversity': 3},
+        'player': ['nAts']
+    },
+    'local example': {
+        'region': {'diversity': 3},
+        'league': {
+            'game-changers': {'min': 2, 'max': 2},
+            'vct-international': {'min': 3, 'max': 3}
+        },
+        'player': ['Didii']
+    },
+    'international only': {'league': {'vct-international': {'min': 5}}},
+    'five regions': {'region': {'diversity': 5}},
+}
+
+
+def run_engine(engine, players, constraints, seed=None):
+    if seed is not None:
+        random.seed(seed)
+    start = time.perf_counter()
+    if engine == 'exact':
+        team = generate.branch_and_bound_team(players, constraints)
+    else:
+        team = generate.genetic_algorithm(players, constraints)
+    elapsed = time.perf_counter() - start
+    fitness = generate.fitness_function(team, constraints) if team else None
+    return elapsed, fitness
+
+
+def benchmark(players, ga_runs=5):
+    results = {}
+    for name, constraints in benchmark_cases.items():
+        ga_times = []
+        ga_fitnesses = []
+        for seed in range(ga_runs):
+            elapsed, fitness = run_engine('genetic', players, constraints, seed)
+            ga_times.append(elapsed)
+            ga_fitnesses.append(fitness)
+        exact_time, exact_fitness = run_engine('exact', players, constraints)
+        results[name] = {
+            'genetic': {
+                'mean_seconds': sum(ga_times) / len(ga_times),
+                'best_fitness': max(ga_fitnesses),
+                'mean_fitness': sum(ga_fitnesses) / len(ga_fitnesses),
+                'optimal_runs': sum(1 for f in ga_fitnesses if exact_fitness - f < 1e-9)
+            },
+            'exact': {'seconds': exact_time, 'fitness': exact_fitness}
+        }
+        print(f"{name}: GA {results[name]['genetic']['mean_seconds']:.2f}s "
+              f"fitness {results[name]['genetic']['mean_fitness']:.4f} "
+              f"(best {results[name]['genetic']['best_fitness']:.4f}, "
+              f"{results[name]['genetic']['optimal_runs']}/{ga_runs} optimal) | "
+              f"exact {exact_time:.2f}s fitness {exact_fitness:.4f}")
+    return results
+
+
+if __name__ == '__main__':
+    data_path = sys.argv[1] if len(sys.argv) > 1 else 'preprocessed_players.json'
+    ga_runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    players = generate.load_preprocessed_data(data_path)
+    players = generate.normalize_player_stats(players)
+    players = generate.calculate_player_scores(players)
+    results = benchmark(players, ga_runs)
+    print(json.dumps(results, indent=4))
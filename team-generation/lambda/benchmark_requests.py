@@ -0,0 +1,312 @@
+import argparse
+import importlib.util
+import json
+import math
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Latency benchmark for team requests: replays a fixed corpus against lambda_handler in-process or against a
+# running server.py, reports p50/p95/p99 latency, throughput, fitness and memory, and compares with a baseline.
+# Latencies are compared in units of a fixed pure-Python workload timed in the same run, so a baseline saved on
+# another machine still compares; the gate uses p50 and p95, as p99 of a small corpus is a single request.
+# Requests whose constraints are feasible but whose team breaks one are reported as PENALIZED; a comparison fails
+# when such a request was not penalized in the baseline. Checks that cannot run are reported as SKIPPED.
+# Usage: python benchmark_requests.py [--server http://127.0.0.1:8080] [--save-baseline] [--compare]
+
+lambda_dir = os.path.dirname(os.path.abspath(__file__))
+module_path = os.path.join(lambda_dir, '2.generate.py')
+spec = importlib.util.spec_from_file_location('generate', module_path)
+generate = importlib.util.module_from_spec(spec)
+sys.modules['generate'] = generate
+spec.loader.exec_module(generate)
+
+api_spec_path = os.path.join(lambda_dir, '..', '..', 'api.yaml')
+default_baseline_path = os.path.join(lambda_dir, 'benchmark_baseline.json')
+
+# Allowed slowdown / fitness loss / memory growth before a comparison run fails
+latency_tolerance = 0.5
+gated_latencies = ['p50_seconds', 'p95_seconds']
+fitness_tolerance = 0.01
+memory_tolerance = 0.2
+
+# __main__ examples of team-generation/lambda/2.generate.py and team-generation/2.generate.py
+main_examples = [
+    {'region': {'diversity': 3},
+     'league': {'game-changers': {'min': 2, 'max': 2}, 'vct-international': {'min': 3, 'max': 3}},
+     'player': ['Didii']},
+    {'league': {'vct-international': {'max': 3}}},
+]
+
+# Constraints that are infeasible or make the search work hardest
+adversarial_examples = [
+    {'player': ['no-such-player']},
+    {'league': {'vct-international': {'min': 3}, 'game-changers': {'min': 3}}},
+    {'region': {'diversity': 5}},
+    {'league': {'vct-challengers': {'exact': 1}, 'game-changers': {'min': 4}}, 'region': {'diversity': 4}},
+    {'league': {'game-changers': {'exact': 5}}, 'region': {'diversity': 5}},
+    {'player': ['Didii', 'nAts', 'Kaspe', 'Jolpi', 'XMS']},
+]
+
+
+def api_examples():
+    # Request examples from api.yaml
+    if yaml is None:
+        print('SKIPPED the api.yaml examples: PyYAML is not installed')
+        return []
+    with open(api_spec_path, 'r', encoding='utf-8') as f:
+        schemas = yaml.safe_load(f)['components']['schemas']
+    examples = [schemas['ConstraintsRequest']['example']['constraints']]
+    examples += [item.get('constraints', {}) for item in schemas['BatchRequest']['example']['batch']]
+    return examples
+
+
+def random_examples(players, count, seed):
+    rng = random.Random(seed)
+    leagues = sorted(generate.league_weights)
+    regions = sorted(set(p['current_region'] for p in players if p.get('current_region')))
+    handles = sorted(set(p['handle'] for p in players if p.get('handle') and p.get('roles')))
+    examples = []
+    for _ in range(count):
+        constraints = {}
+        if rng.random() < 0.6:
+            constraints['league'] = {}
+            for league in rng.sample(leagues, rng.randint(1, len(leagues))):
+                low = rng.randint(0, 3)
+                constraints['league'][league] = rng.choice([{'min': low}, {'max': low + 2}, {'exact': low},
+                                                            {'min': low, 'max': low + 1}])
+        if rng.random() < 0.5:
+            constraints['region'] = {'diversity': rng.randint(1, 4)}
+        if rng.random() < 0.2:
+            constraints.setdefault('region', {})['region_list'] = rng.sample(regions, rng.randint(2, 5))
+        if rng.random() < 0.4:
+            constraints['player'] = rng.sample(handles, rng.randint(1, 2))
+        examples.append(constraints)
+    return examples
+
+
+def feasible(players, constraints):
+    # Whether the constraints pass the generator's own handle and feasibility checks
+    constraints, error = generate.normalize_constraints(constraints)
+    if error is None:
+        constraints, error = generate.resolve_constraint_handles(players, constraints)
+    return error is None and generate.check_constraints_feasibility(players, constraints) is None
+
+
+def build_corpus(players, random_count=20, seed=0):
+    corpus = []
+    for source, examples in [('api', api_examples()), ('main', main_examples), ('adversarial', adversarial_examples),
+                             ('random', random_examples(players, random_count, seed))]:
+        for index, constraints in enumerate(examples):
+            corpus.append({'name': f'{source}-{index}', 'event': {'constraints': constraints},
+                           'feasible': feasible(players, constraints)})
+    # The other engines on the first feasible examples, so they time a search rather than a 400
+    engine_entries = [entry for entry in corpus if entry['feasible']][:2]
+    for engine in ['exact', 'island']:
+        for entry in engine_entries:
+            corpus.append({'name': f"{entry['name']}-{engine}", 'event': dict(entry['event'], engine=engine),
+                           'feasible': True})
+    # Fixed seed and no result cache, so every replay runs the same search
+    for entry in corpus:
+        entry['event'].update(seed=seed, cache_mode='fresh')
+    return corpus
+
+
+def call_in_process(event):
+    return generate.lambda_handler(event, None)
+
+
+def call_server(url, event):
+    request = urllib.request.Request(url.rstrip('/') + '/team', data=json.dumps(event).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return {'statusCode': response.status, 'body': response.read().decode('utf-8')}
+    except urllib.error.HTTPError as e:
+        return {'statusCode': e.code, 'body': e.read().decode('utf-8')}
+
+
+def response_fitness(response, constraints):
+    # (fitness, whether the team breaks a constraint), or (None, None) without a team
+    if response['statusCode'] != 200:
+        return None, None
+    output = json.loads(response['body'])
+    team = [player for player in output.values() if isinstance(player, dict) and 'assigned_role' in player]
+    constraints = generate.normalize_constraints(constraints)[0]
+    return generate.fitness_function(team, constraints), generate.calculate_penalties(team, constraints) > 0
+
+
+def calibration_seconds(repeats=7):
+    # Fastest time of a fixed pure-Python loop; latencies divided by it compare across machines. The minimum is the
+    # least disturbed by other load on the machine.
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        total = 0
+        for i in range(300000):
+            total += i * i % 7
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def run_benchmark(corpus, call, repeats=3, concurrency=1):
+    # Replays every request `repeats` times with `concurrency` concurrent callers
+    jobs = [entry for _ in range(repeats) for entry in corpus]
+    results = {entry['name']: {'latencies': [], 'statuses': set(), 'fitness': None, 'penalized': None}
+               for entry in corpus}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not jobs:
+                    return
+                entry = jobs.pop(0)
+            start = time.perf_counter()
+            response = call(entry['event'])
+            elapsed = time.perf_counter() - start
+            fitness, penalized = response_fitness(response, entry['event']['constraints'])
+            with lock:
+                result = results[entry['name']]
+                result['latencies'].append(elapsed)
+                result['statuses'].add(response['statusCode'])
+                result['fitness'] = fitness
+                result['penalized'] = penalized and entry['feasible']
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start
+    latencies = [latency for result in results.values() for latency in result['latencies']]
+    fitnesses = [result['fitness'] for result in results.values() if result['fitness'] is not None]
+    return {
+        'requests': len(latencies),
+        'p50_seconds': percentile(latencies, 0.50),
+        'p95_seconds': percentile(latencies, 0.95),
+        'p99_seconds': percentile(latencies, 0.99),
+        'throughput_per_second': len(latencies) / wall_time,
+        'mean_fitness': sum(fitnesses) / len(fitnesses) if fitnesses else None,
+        # Peak resident memory of this process; only meaningful in-process
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'per_request': {name: {'p50_seconds': percentile(result['latencies'], 0.50),
+                               'status': sorted(result['statuses']),
+                               'fitness': result['fitness'],
+                               'penalized': result['penalized']} for name, result in results.items()},
+    }
+
+
+def machine():
+    # Where a run happened, for the record; comparisons do not depend on it
+    return {'host': platform.node(), 'cpus': os.cpu_count(), 'python': platform.python_version()}
+
+
+def compare_with_baseline(summary, baseline):
+    # Returns (regressions, skipped checks); no regressions when the run is within tolerance. Latencies are compared
+    # relative to each run's calibration_seconds, memory only with the same Python version, fitness over the
+    # requests both runs made.
+    regressions = []
+    skipped = []
+    if baseline.get('calibration_seconds') and summary.get('calibration_seconds'):
+        for metric in gated_latencies:
+            relative = summary[metric] / summary['calibration_seconds']
+            expected = baseline[metric] / baseline['calibration_seconds']
+            if relative > expected * (1 + latency_tolerance):
+                regressions.append(f'{metric}: {relative:.1f} vs baseline {expected:.1f} calibration units '
+                                   f'({summary[metric]:.3f}s vs {baseline[metric]:.3f}s)')
+    else:
+        skipped.append('latency: the baseline has no calibration_seconds; save it again with --save-baseline')
+    if summary['max_rss_mb'] is None or baseline.get('max_rss_mb') is None:
+        skipped.append('memory: measured in-process only')
+    elif summary['machine']['python'] != baseline.get('machine', {}).get('python'):
+        skipped.append('memory: the baseline was saved with another Python version')
+    elif summary['max_rss_mb'] > baseline['max_rss_mb'] * (1 + memory_tolerance):
+        regressions.append(f"max_rss_mb: {summary['max_rss_mb']:.1f} vs baseline {baseline['max_rss_mb']:.1f}")
+    shared = [name for name in summary['per_request'] if name in baseline['per_request']]
+    if len(shared) < len(summary['per_request']) or len(shared) < len(baseline['per_request']):
+        skipped.append(f"{len(summary['per_request']) + len(baseline['per_request']) - 2 * len(shared)} "
+                       f"requests that only one of the runs made")
+    fitness_pairs = [(summary['per_request'][name]['fitness'], baseline['per_request'][name]['fitness'])
+                     for name in shared]
+    fitness_pairs = [pair for pair in fitness_pairs if None not in pair]
+    if fitness_pairs:
+        mean_fitness = sum(fitness for fitness, _ in fitness_pairs) / len(fitness_pairs)
+        expected = sum(fitness for _, fitness in fitness_pairs) / len(fitness_pairs)
+        if mean_fitness < expected - fitness_tolerance:
+            regressions.append(f'mean_fitness: {mean_fitness:.4f} vs baseline {expected:.4f}')
+    if not all('penalized' in request for request in baseline['per_request'].values()):
+        skipped.append('penalized teams: the baseline does not record them; save it again with --save-baseline')
+    for name in shared:
+        result = summary['per_request'][name]
+        expected = baseline['per_request'][name]
+        if result['status'] != expected['status']:
+            regressions.append(f"{name}: status {result['status']} vs baseline {expected['status']}")
+        if result['penalized'] and expected.get('penalized') is False:
+            regressions.append(f'{name}: the team breaks a feasible constraint, unlike in the baseline')
+    return regressions, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark team generation requests.')
+    parser.add_argument('--data', default=generate.player_data_file, help='preprocessed player data file')
+    parser.add_argument('--server', help='base URL of a running server.py; in-process when omitted')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='concurrent callers against --server; in-process runs are sequential')
+    parser.add_argument('--random', type=int, default=20, help='number of random constraint sets')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=default_baseline_path)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--compare', action='store_true', help='exit with status 1 on a regression')
+    args = parser.parse_args()
+
+    generate.player_data_file = args.data
+    players = generate.load_player_data(args.data)
+    corpus = build_corpus(players, args.random, args.seed)
+    calibration = calibration_seconds()
+    if args.server:
+        summary = run_benchmark(corpus, lambda event: call_server(args.server, event), args.repeats, args.concurrency)
+        summary['max_rss_mb'] = None  # The searches run in the server's processes
+    else:
+        summary = run_benchmark(corpus, call_in_process, args.repeats)
+    summary['calibration_seconds'] = min(calibration, calibration_seconds())  # Before and after the requests
+    summary['machine'] = machine()
+    print(f"{summary['requests']} requests: p50 {summary['p50_seconds']:.3f}s p95 {summary['p95_seconds']:.3f}s "
+          f"p99 {summary['p99_seconds']:.3f}s, {summary['throughput_per_second']:.2f} req/s, "
+          f"mean fitness {summary['mean_fitness']:.4f}, max RSS "
+          f"{'n/a' if summary['max_rss_mb'] is None else format(summary['max_rss_mb'], '.1f')} MB")
+    for name, result in summary['per_request'].items():
+        if result['penalized']:
+            print(f"PENALIZED {name}: feasible constraints, but the team breaks one (fitness {result['fitness']:.2f})")
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4)
+        print(f'Baseline saved to {args.baseline}')
+    if args.compare:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions, skipped = compare_with_baseline(summary, baseline)
+        for check in skipped:
+            print(f'SKIPPED {check}')
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,75 @@
+import bisect
+import json
+import os
+
+import result_cache
+
+# Co-play graph written by "1.5. build-coplay-graph.py": recency-weighted games each pair played on the same team
+coplay_graph_file = os.environ.get('TEAM_COPLAY_GRAPH',
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), 'coplay_graph.json'))
+
+# Recency-weighted games together at which a pair's co-play chemistry is full
+saturation_games = 10
+
+loaded_graph = {'version': None, 'graph': None}
+
+
+def load_coplay_graph(path=None):
+    # Re-read when the file changes; None when no graph has been built. Called once per request, the pair lookups
+    # then read loaded_graph without touching the file system.
+    path = path or coplay_graph_file
+    try:
+        version = result_cache.data_version(path)
+    except OSError:
+        loaded_graph['version'] = None
+        loaded_graph['graph'] = None
+        return None
+    if version != loaded_graph['version']:
+        with open(path, 'r', encoding='utf-8') as f:
+            graph = json.load(f)
+        # Edge weights decayed to the graph's latest year, and the row of every player id
+        decay = 2 ** ((graph['base_year'] - (graph['year'] or graph['base_year'])) / graph['half_life_years'])
+        graph['weights'] = [recent * decay for recent in graph['recent']]
+        graph['rows'] = {player_id: row for row, player_id in enumerate(graph['players'])}
+        loaded_graph['graph'] = graph
+        loaded_graph['version'] = version
+    return loaded_graph['graph']
+
+
+def coplay_games(graph, player_id, other_id):
+    # Recency-weighted games the two played on the same team; 0 when they never did
+    row = graph['rows'].get(player_id)
+    column = graph['rows'].get(other_id)
+    if row is None or column is None:
+        return 0
+    start, end = graph['indptr'][row], graph['indptr'][row + 1]
+    position = bisect.bisect_left(graph['indices'], column, start, end)
+    if position < end and graph['indices'][position] == column:
+        return graph['weights'][position]
+    return 0
+
+
+def coplay_strength(player_id, other_id):
+    # Co-play chemistry of a pair between 0 and 1, from the loaded graph
+    graph = loaded_graph['graph']
+    if graph is None:
+        return 0
+    return min(1, coplay_games(graph, player_id, other_id) / saturation_games)
+
+
+def has_teammates(player_id):
+    # Whether the loaded graph has any teammate of the player, i.e. whether they can have co-play chemistry
+    graph = loaded_graph['graph']
+    row = graph['rows'].get(player_id) if graph is not None else None
+    return row is not None and graph['indptr'][row + 1] > graph['indptr'][row]
+
+
+def player_teammates(player_id):
+    # Co-play strength with every teammate of the player in the loaded graph
+    graph = loaded_graph['graph']
+    row = graph['rows'].get(player_id) if graph is not None else None
+    if row is None:
+        return {}
+    start, end = graph['indptr'][row], graph['indptr'][row + 1]
+    return {graph['players'][graph['indices'][position]]: min(1, graph['weights'][position] / saturation_games)
+            for position in range(start, end)}
@@ -0,0 +1,81 @@
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import sys
+import tracemalloc
+
+# Memory report for the Lambda generator: runs a reference request under tracemalloc and prints the memory held
+# after and the peak during each pipeline stage. Exits with status 1 when the overall peak exceeds the threshold,
+# so it can guard memory regressions before the function's memory size is changed.
+# Usage: python memory_report.py [--data preprocessed_players.json] [--max-peak-mb 32]
+
+module_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '2.generate.py')
+spec = importlib.util.spec_from_file_location('generate', module_path)
+generate = importlib.util.module_from_spec(spec)
+sys.modules['generate'] = generate
+spec.loader.exec_module(generate)
+
+# Peak traced memory allowed for the reference request, in MB
+max_peak_mb = 32
+
+# The __main__ example of 2.generate.py
+reference_event = {
+    'constraints': {
+        'region': {'diversity': 3},
+        'league': {'game-changers': {'min': 2, 'max': 2}, 'vct-international': {'min': 3, 'max': 3}},
+        'player': ['Didii']
+    },
+    'seed': 0,
+    'cache_mode': 'fresh',
+    'debug': True
+}
+
+# Pipeline stages and the timing stages they cover
+pipeline_stages = {
+    'load': ['load_preprocessed_data', 'attach_ratings', 'attach_recent_form'],
+    'score': ['normalize_player_stats', 'calculate_player_scores', 'resolve_constraint_handles',
+              'apply_weight_profile', 'apply_map_weights', 'check_constraints_feasibility', 'prune_candidate_pool'],
+    'population': ['generate_initial_population'],
+    'generations': ['generations', 'branch_and_bound_team', 'island_genetic_algorithm'],
+    'output': ['construct_output'],
+}
+
+
+def memory_report(event, data_file):
+    generate.player_data_file = data_file
+    tracemalloc.start()
+    try:
+        response = generate.lambda_handler(event, None)
+    finally:
+        tracemalloc.stop()
+    if response['statusCode'] != 200:
+        raise RuntimeError(f"Reference request failed: {response['body']}")
+    memory = json.loads(response['body'])['timings']['memory']
+    report = {}
+    for pipeline_stage, stages in pipeline_stages.items():
+        measured = [memory[stage] for stage in stages if stage in memory]
+        if measured:
+            report[pipeline_stage] = {'current_mb': measured[-1]['current_bytes'] / 2 ** 20,
+                                      'peak_mb': max(m['peak_bytes'] for m in measured) / 2 ** 20}
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report memory per pipeline stage for a reference request.')
+    parser.add_argument('--data', default=generate.player_data_file, help='preprocessed player data file')
+    parser.add_argument('--engine', default='genetic', choices=['genetic', 'island', 'exact'])
+    parser.add_argument('--max-peak-mb', type=float, default=max_peak_mb)
+    args = parser.parse_args()
+
+    report = memory_report(dict(reference_event, engine=args.engine), args.data)
+    for pipeline_stage, usage in report.items():
+        print(f"{pipeline_stage:12} held {usage['current_mb']:8.1f} MB   peak {usage['peak_mb']:8.1f} MB")
+    peak_mb = max(usage['peak_mb'] for usage in report.values())
+    print(f"Peak traced memory {peak_mb:.1f} MB, process max RSS "
+          f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    if peak_mb > args.max_peak_mb:
+        print(f'FAIL: peak {peak_mb:.1f} MB exceeds the {args.max_peak_mb:.1f} MB threshold')
+        sys.exit(1)
+    print(f'OK: peak within the {args.max_peak_mb:.1f} MB threshold')
@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+import zipfile
+
+# Builds the Lambda deployment package: every module the handler imports and whichever data files the builders have
+# written to this directory, all at the root of the zip. A data file missing here is carried over from the existing
+# package, so lambda.zip can be rebuilt after a code change without regenerating the player data.
+# Usage: python package_lambda.py [--output lambda.zip]
+
+lambda_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Modules imported by 2.generate.py; server.py, the benchmarks and the reports only run outside Lambda
+modules = ['2.generate.py', 'result_cache.py', 'ratings.py', 'stat_cube.py', 'coplay_graph.py', 'roster_history.py']
+
+# Data files read by the function, with the script that writes each; all are optional but the player data
+data_files = {
+    'preprocessed_players.json': '1.2. determine-league.py',
+    'preprocessed_players.hot.json': '1.3. split-player-data.py',
+    'preprocessed_players.cold.jsonl': '1.3. split-player-data.py',
+    'weight_profiles.json': 'edited by hand',
+    'stat_cube.json': '1.4. build-stat-cube.py',
+    'coplay_graph.json': '1.5. build-coplay-graph.py',
+    'roster_history.json': '1.6. build-roster-history.py',
+    'ratings.json': '1.7. build-ratings.py',
+}
+player_data_files = ['preprocessed_players.json', 'preprocessed_players.hot.json']
+
+# Fixed timestamp, so unchanged files give an identical package
+zip_date_time = (1980, 1, 1, 0, 0, 0)
+
+
+def package_contents(previous):
+    # {name in the package: (source, bytes)} of the modules and the data files found here or in the previous
+    # package (a ZipFile, or None)
+    contents = {}
+    for name in modules + list(data_files):
+        path = os.path.join(lambda_dir, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                contents[name] = ('lambda directory', f.read())
+        elif name in data_files and previous is not None and name in previous.namelist():
+            contents[name] = ('previous package', previous.read(name))
+        elif name in modules:
+            raise FileNotFoundError(f'{name} is missing from {lambda_dir}')
+    return contents
+
+
+def write_package(output_file, contents):
+    # Written to a temporary file first, so a failed run leaves the previous package in place
+    temp_file = output_file + '.tmp'
+    with zipfile.ZipFile(temp_file, 'w', zipfile.ZIP_DEFLATED) as package:
+        for name, (_, data) in sorted(contents.items()):
+            info = zipfile.ZipInfo(name, zip_date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            package.writestr(info, data)
+    os.replace(temp_file, output_file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the Lambda deployment package.')
+    parser.add_argument('--output', default=os.path.join(lambda_dir, 'lambda.zip'))
+    args = parser.parse_args()
+
+    previous = zipfile.ZipFile(args.output) if os.path.isfile(args.output) else None
+    try:
+        contents = package_contents(previous)
+    finally:
+        if previous is not None:
+            previous.close()
+    if not any(name in contents for name in player_data_files):
+        sys.exit('No player data found: run "1.2. determine-league.py" (and optionally "1.3. split-player-data.py") '
+                 'first')
+    write_package(args.output, contents)
+    for name, (source, data) in sorted(contents.items()):
+        print(f'{name:34} {len(data) / 1024:10.1f} KB  from {source}')
+    for name, writer in data_files.items():
+        if name not in contents:
+            print(f'{name:34} not packaged; written by {writer}')
+    print(f'Packaged {len(contents)} files in {args.output}')
@@ -0,0 +1,50 @@
+import bisect
+import json
+import os
+
+import result_cache
+
+# Elo ratings written by "1.7. build-ratings.py": every team's and player's rating with its history
+ratings_file = os.environ.get('TEAM_RATINGS',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ratings.json'))
+
+# Rating of players without rated matches
+initial_rating = 1500
+
+loaded_ratings = {'version': None, 'ratings': None}
+
+
+def load_ratings(path=None):
+    # Re-read when the file changes; None when no ratings have been built
+    path = path or ratings_file
+    try:
+        version = result_cache.data_version(path)
+    except OSError:
+        loaded_ratings['version'] = None
+        loaded_ratings['ratings'] = None
+        return None
+    if version != loaded_ratings['version']:
+        with open(path, 'r', encoding='utf-8') as f:
+            loaded_ratings['ratings'] = json.load(f)
+        loaded_ratings['version'] = version
+    return loaded_ratings['ratings']
+
+
+def player_rating(player_id, date=None):
+    # The player's rating, or their rating after the last match on or before date (YYYY-MM-DD); None when they have
+    # no rated match by then or no ratings are loaded
+    ratings = loaded_ratings['ratings']
+    entry = ratings['players'].get(player_id) if ratings is not None else None
+    if entry is None:
+        return None
+    if date is None:
+        return entry['rating']
+    position = bisect.bisect_right(entry['history'], [date, float('inf')])
+    return entry['history'][position - 1][1] if position else None
+
+
+def rating_strength(rating):
+    # Chance to beat an average (initial rating) opponent, between 0 and 1; 0.5 for unrated players
+    if rating is None:
+        return 0.5
+    return 1 / (1 + 10 ** ((initial_rating - rating) / 400))
@@ -0,0 +1,109 @@
+import errno
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+# In-process tier: LRU with a time-to-live per entry
+cache_max_entries = 256
+cache_ttl_seconds = 3600
+
+# Optional shared tier: one JSON file per entry in this directory (e.g. /tmp inside Lambda or a shared volume)
+disk_cache_dir = os.environ.get('TEAM_CACHE_DIR')
+
+# Seconds a file's version is trusted before the file is checked again, so a burst of requests does not stat every
+# data file for every request; edits to the data files apply within this delay
+version_check_seconds = float(os.environ.get('TEAM_VERSION_CHECK_SECONDS', 1))
+
+memory_cache = OrderedDict()
+
+# path -> (time of the last check, version, or None when the file was missing)
+checked_versions = {}
+
+
+def canonical_constraints(constraints):
+    # Handle, region and map lists are sets, so their order must not change the key
+    constraints = dict(constraints)
+    if 'player' in constraints:
+        constraints['player'] = sorted(set(constraints['player']))
+    if isinstance(constraints.get('maps'), list):
+        constraints['maps'] = sorted(set(map(str, constraints['maps'])))
+    if 'region' in constraints and 'region_list' in constraints['region']:
+        constraints['region'] = dict(constraints['region'], region_list=sorted(set(constraints['region']['region_list'])))
+    return json.dumps(constraints, sort_keys=True, separators=(',', ':'))
+
+
+def data_version(file_path):
+    # Changes whenever the player data file is replaced, which invalidates every cached result. Raises
+    # FileNotFoundError for a missing file, like os.stat.
+    now = time.monotonic()
+    checked = checked_versions.get(file_path)
+    if checked is None or now - checked[0] >= version_check_seconds:
+        try:
+            stat = os.stat(file_path)
+            checked = (now, f'{stat.st_mtime_ns}-{stat.st_size}')
+        except FileNotFoundError:
+            checked = (now, None)
+        checked_versions[file_path] = checked
+    if checked[1] is None:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), file_path)
+    return checked[1]
+
+
+def cache_key(constraints, version, seed, options=None):
+    payload = json.dumps({'constraints': canonical_constraints(constraints), 'data_version': version,
+                          'seed': seed, 'options': options or {}}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_get(key):
+    now = time.time()
+    entry = memory_cache.get(key)
+    if entry is not None:
+        expires_at, value = entry
+        if expires_at > now:
+            memory_cache.move_to_end(key)
+            return value
+        del memory_cache[key]
+    if disk_cache_dir:
+        path = os.path.join(disk_cache_dir, key + '.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['expires_at'] > now:
+            store_in_memory(key, entry['value'], entry['expires_at'])
+            return entry['value']
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return None
+
+
+def store_in_memory(key, value, expires_at):
+    memory_cache[key] = (expires_at, value)
+    memory_cache.move_to_end(key)
+    while len(memory_cache) > cache_max_entries:
+        memory_cache.popitem(last=False)
+
+
+def cache_put(key, value):
+    expires_at = time.time() + cache_ttl_seconds
+    store_in_memory(key, value, expires_at)
+    if disk_cache_dir:
+        os.makedirs(disk_cache_dir, exist_ok=True)
+        path = os.path.join(disk_cache_dir, key + '.json')
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': expires_at, 'value': value}, f)
+            os.replace(temp_path, path)  # Atomic, so concurrent readers never see a partial entry
+        except OSError:
+            pass  # The disk tier is best effort
+
+
+def clear_cache():
+    memory_cache.clear()
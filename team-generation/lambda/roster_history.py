@@ -0,0 +1,96 @@
+import json
+import os
+
+import result_cache
+
+# Roster history written by "1.6. build-roster-history.py": team id -> time-ordered player stints, plus every
+# player's current team
+roster_history_file = os.environ.get('TEAM_ROSTER_HISTORY',
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'roster_history.json'))
+
+loaded_history = {'version': None, 'history': None}
+
+# past_team_keys of every (player_id, handle) looked up since the history or the roster last changed
+team_keys = {}
+
+
+def load_roster_history(path=None):
+    # Re-read when the file changes; None when no history has been built. Called once per request, the lookups then
+    # read loaded_history without touching the file system.
+    path = path or roster_history_file
+    try:
+        version = result_cache.data_version(path)
+    except OSError:
+        if loaded_history['history'] is not None:
+            team_keys.clear()
+        loaded_history['version'] = None
+        loaded_history['history'] = None
+        return None
+    if version != loaded_history['version']:
+        with open(path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+        index_roster_history(history)
+        team_keys.clear()
+        loaded_history['history'] = history
+        loaded_history['version'] = version
+    return loaded_history['history']
+
+
+def index_roster_history(history):
+    # Teams numbered in sorted id order; every player's teams as a set of those numbers and their stints by team
+    history['team_ids'] = sorted(set(history['teams']) | set(history['home_teams'].values()))
+    numbers = {team_id: number for number, team_id in enumerate(history['team_ids'])}
+    player_teams = {}
+    player_stints = {}
+    for team_id, team in history['teams'].items():
+        for player_id, first_game, last_game, first_year, last_year, games in team['stints']:
+            player_teams.setdefault(player_id, set()).add(numbers[team_id])
+            player_stints.setdefault(player_id, {}).setdefault(numbers[team_id], []).append(
+                (first_game, last_game, first_year, last_year, games))
+    for player_id, team_id in history['home_teams'].items():
+        player_teams.setdefault(player_id, set()).add(numbers[team_id])
+    history['player_teams'] = {player_id: frozenset(teams) for player_id, teams in player_teams.items()}
+    history['player_stints'] = player_stints
+
+
+def past_team_keys(player):
+    # The player's teams as comparable keys: the scraped past team names, plus the numbers of the official teams
+    # they played for or play for when a roster history is loaded. Built once per player, since pair chemistry asks
+    # for them in the search's innermost loop.
+    key = (player.get('player_id'), player.get('handle'))
+    keys = team_keys.get(key)
+    if keys is None:
+        keys = frozenset(team['team_name'] for team in player.get('past_teams', []))
+        history = loaded_history['history']
+        if history is not None:
+            keys |= history['player_teams'].get(player.get('player_id'), frozenset())
+        team_keys[key] = keys
+    return keys
+
+
+def clear_team_keys():
+    # Past team names come from the player data, so a reloaded or upserted roster drops the built keys
+    team_keys.clear()
+
+
+def teammate_periods(player_id, other_id):
+    # When the two were on the same team: their overlapping stints on every team both played for, oldest first,
+    # and the team both currently play for. Empty when they never were teammates.
+    history = loaded_history['history']
+    common = history['player_teams'].get(player_id, frozenset()) & history['player_teams'].get(other_id, frozenset())
+    periods = []
+    for number in sorted(common):
+        team_id = history['team_ids'][number]
+        team = history['teams'].get(team_id, {})
+        for first_game, last_game, first_year, last_year, games in history['player_stints'].get(player_id, {}).get(
+                number, []):
+            for other_first, other_last, other_first_year, other_last_year, _ in history['player_stints'].get(
+                    other_id, {}).get(number, []):
+                if first_game <= other_last and other_first <= last_game:
+                    periods.append({'team_id': team_id, 'team': team.get('name'),
+                                    'from_year': max(filter(None, [first_year, other_first_year]), default=None),
+                                    'to_year': min(filter(None, [last_year, other_last_year]), default=None),
+                                    'team_games': min(last_game, other_last) - max(first_game, other_first) + 1})
+        if history['home_teams'].get(player_id) == team_id == history['home_teams'].get(other_id):
+            periods.append({'team_id': team_id, 'team': team.get('name'), 'current': True})
+    return sorted(periods, key=lambda period: (period.get('from_year') or 9999, period['team_id']))
@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import concurrent.futures
+import gzip
+import importlib.util
+import json
+import logging
+import os
+import signal
+import sys
+
+# Self-hosted HTTP server for the endpoints in api.yaml (POST /team, POST /team/batch, POST /team/evaluate,
+# POST /players, POST /players/suggest, POST /players/similar and POST /players/teammates), standing in for API
+# Gateway + Lambda. The player data is loaded once and shared by a bounded pool of worker processes, so the
+# CPU-bound searches never block the event loop.
+# Usage: python server.py [--host 127.0.0.1] [--port 8080] [--workers N] [--timeout 30]
+
+module_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '2.generate.py')
+spec = importlib.util.spec_from_file_location('generate', module_path)
+generate = importlib.util.module_from_spec(spec)
+sys.modules['generate'] = generate
+spec.loader.exec_module(generate)
+
+max_body_bytes = 1024 * 1024
+header_timeout_seconds = 10
+shutdown_grace_seconds = 30
+
+# Player upserts replayed to the workers with each request; past this the workers restart from the updated roster
+max_roster_updates = 32
+
+status_reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                  408: 'Request Timeout', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+                  500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+
+def error_response(status, message):
+    return {'statusCode': status, 'body': json.dumps({'error': message})}
+
+
+def start_executor(state):
+    return concurrent.futures.ProcessPoolExecutor(max_workers=state['workers'], initializer=generate.init_batch_worker,
+                                                  initargs=(state['players'], generate.stat_index))
+
+
+async def run_in_worker(state, function, item):
+    if state['pending'] >= state['max_pending']:
+        return error_response(503, 'Server is busy, try again later.')
+    state['pending'] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(state['executor'], function, item)
+        return await asyncio.wait_for(future, state['timeout'])
+    except asyncio.TimeoutError:
+        return error_response(504, f"Team generation did not finish within {state['timeout']} seconds.")
+    finally:
+        state['pending'] -= 1
+
+
+async def run_team_request(state, event):
+    # Cached results are answered on the event loop, everything else goes to the worker pool
+    constraints, error = generate.normalize_constraints(event.get('constraints', {}))
+    if error:
+        return error_response(400, error)
+    key, seed = generate.request_cache_key(event, constraints)
+    if key is not None:
+        cached = generate.result_cache.cache_get(key)
+        if cached is not None:
+            return cached
+    response = await run_in_worker(state, generate.run_batch_item,
+                                   (event, constraints, seed, list(state['roster_updates'])))
+    if key is not None and response['statusCode'] == 200:
+        generate.result_cache.cache_put(key, response)
+    return response
+
+
+async def run_batch_request(state, body):
+    items = body.get('batch')
+    if not isinstance(items, list):
+        return error_response(400, 'batch must be a list of team requests.')
+    responses = await asyncio.gather(*[
+        run_team_request(state, item) if isinstance(item, dict)
+        else asyncio.sleep(0, error_response(400, 'Each batch item must be a team request object.'))
+        for item in items])
+    return {'statusCode': 200,
+            'body': json.dumps({'results': [{'statusCode': response['statusCode'],
+                                             'body': json.loads(response['body'])} for response in responses]})}
+
+
+def run_upsert_request(state, body):
+    # Applied to the served roster right away; workers catch up from roster_updates before their next search
+    updates = body.get('players')
+    error = generate.check_player_updates(updates)
+    if error:
+        return error_response(400, error)
+    summary = generate.upsert_players(state['players'], updates)
+    state['roster_updates'].append(updates)
+    if len(state['roster_updates']) > max_roster_updates:
+        executor = state['executor']
+        state['executor'] = start_executor(state)
+        state['roster_updates'] = []
+        executor.shutdown(wait=False)  # Searches already running on the old workers still finish
+    return {'statusCode': 200, 'body': json.dumps(summary)}
+
+
+async def route(state, method, path, body):
+    path = path.split('?', 1)[0].rstrip('/')
+    if path not in ('/team', '/team/batch', '/team/evaluate', '/players', '/players/suggest',
+                    '/players/similar', '/players/teammates'):
+        return error_response(404, f'No endpoint at {path}.')
+    if method != 'POST':
+        return error_response(405, f'{path} only accepts POST.')
+    try:
+        payload = json.loads(body) if body.strip() else {}
+    except ValueError:
+        return error_response(400, 'Request body is not valid JSON.')
+    if not isinstance(payload, dict):
+        return error_response(400, 'Request body must be a JSON object.')
+    if path == '/team':
+        return await run_team_request(state, payload)
+    if path == '/team/evaluate':
+        return await run_in_worker(state, generate.run_evaluate_item, (payload, list(state['roster_updates'])))
+    if path == '/players':
+        return run_upsert_request(state, payload)
+    if path == '/players/suggest':
+        return generate.suggest_response(payload, state['players'])  # Index lookups, cheap enough for the event loop
+    if path == '/players/similar':
+        return generate.similar_response(payload, state['players'])
+    if path == '/players/teammates':
+        return generate.teammates_response(payload, state['players'])
+    return await run_batch_request(state, payload)
+
+
+async def read_request(reader):
+    # Returns (method, path, headers, body), or None when the client closed the connection. A request that cannot
+    # be served raises ValueError(status code, message): 400 when malformed, 413 when the body is too large.
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), header_timeout_seconds)
+    except asyncio.IncompleteReadError:
+        return None
+    lines = head.decode('latin-1').split('\r\n')
+    request_line = lines[0].split(' ')
+    if len(request_line) != 3:
+        raise ValueError(400, 'Malformed request line.')
+    method, path, _ = request_line
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    length = headers.get('content-length', '0')
+    if not (length.isascii() and length.isdigit()):
+        raise ValueError(400, 'Content-Length must be a non-negative integer.')
+    length = int(length)
+    if length > max_body_bytes:
+        raise ValueError(413, 'Request body is too large.')
+    body = await asyncio.wait_for(reader.readexactly(length), header_timeout_seconds) if length else b''
+    try:
+        return method, path, headers, body.decode('utf-8')
+    except UnicodeDecodeError:
+        raise ValueError(400, 'Request body is not valid UTF-8.')
+
+
+async def write_response(writer, response, keep_alive, compress=False):
+    status = response['statusCode']
+    body = response['body'].encode('utf-8')
+    encoding_header = ''
+    if compress and len(body) >= generate.gzip_min_bytes:
+        body = gzip.compress(body)
+        encoding_header = 'Content-Encoding: gzip\r\n'
+    head = (f"HTTP/1.1 {status} {status_reasons.get(status, 'Unknown')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"{encoding_header}"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+async def handle_connection(state, reader, writer):
+    state['connections'].add(writer)
+    try:
+        while not state['shutting_down']:
+            try:
+                request = await read_request(reader)
+            except asyncio.TimeoutError:
+                await write_response(writer, error_response(408, 'Request was not received in time.'), False)
+                break
+            except asyncio.LimitOverrunError:
+                await write_response(writer, error_response(431, 'Request headers are too large.'), False)
+                break
+            except ValueError as e:
+                await write_response(writer, error_response(*e.args), False)
+                break
+            if request is None:
+                break
+            method, path, headers, body = request
+            state['active'] += 1
+            try:
+                try:
+                    response = await route(state, method, path, body)
+                except Exception as e:
+                    response = error_response(500, f'Team generation failed: {e}')
+                keep_alive = headers.get('connection', '').lower() != 'close' and not state['shutting_down']
+                await write_response(writer, response, keep_alive, generate.accepts_gzip(headers))
+            finally:
+                state['active'] -= 1
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        state['connections'].discard(writer)
+        writer.close()
+
+
+async def serve(host, port, workers, timeout, max_pending, data_file):
+    generate.player_data_file = data_file  # Cache keys follow the served data file
+    state = {'players': generate.load_player_data(data_file), 'roster_updates': [], 'workers': workers,
+             'timeout': timeout, 'max_pending': max_pending, 'pending': 0, 'active': 0, 'connections': set(),
+             'shutting_down': False}
+    state['executor'] = start_executor(state)
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(state, reader, writer), host, port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+    print(f'Serving on http://{host}:{port} with {workers} workers', flush=True)
+    await stop.wait()
+    # Graceful shutdown: stop accepting connections, let in-flight requests finish, then stop the workers
+    state['shutting_down'] = True
+    server.close()
+    for _ in range(shutdown_grace_seconds * 10):
+        if state['active'] == 0:
+            break
+        await asyncio.sleep(0.1)
+    for writer in list(state['connections']):
+        writer.close()
+    state['executor'].shutdown(wait=False, cancel_futures=True)
+    print('Server stopped', flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the team generation API over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--timeout', type=float, default=30, help='seconds before a search answers 504')
+    parser.add_argument('--max-pending', type=int, default=64, help='queued searches before answering 503')
+    parser.add_argument('--data', default=generate.player_data_file, help='preprocessed player data file')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)  # The request timing logs of 2.generate.py go to stderr
+    asyncio.run(serve(args.host, args.port, args.workers, args.timeout, args.max_pending, args.data))
@@ -0,0 +1,263 @@
+import atexit
+import contextlib
+import datetime
+import importlib.util
+import io
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Smoke tests for the Lambda generator and "1.7. build-ratings.py" on a synthetic roster written to a temporary
+# directory, so they need neither the real player data nor any deployed data file.
+# Usage: python smoke_test.py
+
+lambda_dir = os.path.dirname(os.path.abspath(__file__))
+temp_dir = tempfile.mkdtemp(prefix='team-smoke-')
+atexit.register(shutil.rmtree, temp_dir, True)
+
+# Point every optional data file into the empty temporary directory and check file versions on every request
+for variable, name in [('TEAM_RATINGS', 'ratings.json'), ('TEAM_STAT_CUBE', 'stat_cube.json'),
+                       ('TEAM_COPLAY_GRAPH', 'coplay_graph.json'), ('TEAM_ROSTER_HISTORY', 'roster_history.json'),
+                       ('TEAM_WEIGHT_PROFILES', 'weight_profiles.json')]:
+    os.environ[variable] = os.path.join(temp_dir, name)
+os.environ.pop('TEAM_CACHE_DIR', None)
+os.environ['TEAM_VERSION_CHECK_SECONDS'] = '0'
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+generate = load_module('generate', os.path.join(lambda_dir, '2.generate.py'))
+sys.path.insert(0, os.path.dirname(lambda_dir))  # esports_data, imported by the builders
+build_ratings = load_module('build_ratings', os.path.join(os.path.dirname(lambda_dir), '1.7. build-ratings.py'))
+
+leagues = ['vct-international', 'vct-challengers', 'game-changers']
+regions = ['EMEA', 'AMER', 'PACIFIC', 'CN']
+nationalities = ['FRANCE', 'BRAZIL', 'KOREA', 'JAPAN', 'USA']
+team_names = ['Alpha Esports', 'Bravo Gaming', 'Charlie Club', 'Delta Force', 'Echo Five', 'Foxtrot']
+
+
+def synthetic_player(rng, index):
+    roles = rng.sample(generate.score_roles[:4], rng.randint(1, 3))
+    return {
+        'player_id': str(1000 + index),
+        'handle': 'Vortex' if index == 0 else f'player{index:02d}',
+        'league': leagues[index % len(leagues)],
+        'current_region': regions[index % len(regions)],
+        'previous_regions': [regions[index % len(regions)]],
+        'nationality': rng.choice(nationalities),
+        'roles': roles,
+        'role_versatility': str(len(roles)),
+        'past_teams': [{'team_name': name, 'period': 'January 2023 – Present'} for name in rng.sample(team_names, 2)],
+        'acs': round(rng.uniform(150, 300), 1),
+        'kd_ratio': round(rng.uniform(0.7, 1.5), 2),
+        'assist_score': round(rng.uniform(0, 1), 3),
+        'map_awareness': round(rng.uniform(0, 1), 3),
+        'team_survival_trade_efficiency': round(rng.uniform(0, 1), 3),
+        'adr': round(rng.uniform(100, 200), 1),
+        'clutch_factor': round(rng.uniform(0, 1), 3),
+        'agent_specialization': {'jett': rng.randint(0, 500)},
+        'recent_match_result': '[]',
+        'latest_news': '[]',
+    }
+
+
+def synthetic_roster(count=40, seed=7):
+    rng = random.Random(seed)
+    return [synthetic_player(rng, index) for index in range(count)]
+
+
+def write_roster(players, name='preprocessed_players.json'):
+    path = os.path.join(temp_dir, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(players, f)
+    return path
+
+
+def call(event):
+    response = generate.lambda_handler(dict(event, cache_mode='fresh'), None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def response_team(body):
+    return [player for player in body.values() if isinstance(player, dict) and 'assigned_role' in player]
+
+
+def brute_force_fitness(players, constraints):
+    # Best fitness_function over every role-complete team of the players the constraints allow
+    best = None
+    for members in itertools.combinations(generate.filter_players_by_constraints(players, constraints), 5):
+        for roles in itertools.permutations(generate.score_roles):
+            if any(role not in member['role_scores'] or (role == 'Flex' and len(member['roles']) < 2)
+                   for member, role in zip(members, roles)):
+                continue
+            team = [dict(member, assigned_role=role) for member, role in zip(members, roles)]
+            fitness = generate.fitness_function(team, constraints)
+            best = fitness if best is None else max(best, fitness)
+    return best
+
+
+class GeneratorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.raw_players = synthetic_roster()
+        generate.player_data_file = write_roster(cls.raw_players)
+
+    def setUp(self):
+        self.players = generate.get_player_data()
+
+    def test_team_request(self):
+        status, body = call({'constraints': {'region': {'diversity': 2}}, 'seed': 1})
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(player['assigned_role'] for player in response_team(body)),
+                         sorted(generate.score_roles))
+
+    def test_exact_engine_is_optimal(self):
+        constraints = {'region': {'diversity': 3}, 'player': ['player04']}
+        pool = self.players[:11]
+        team, metadata = generate.branch_and_bound_team(pool, constraints, return_metadata=True)
+        self.assertTrue(metadata['optimal'])
+        self.assertAlmostEqual(generate.fitness_function(team, constraints), brute_force_fitness(pool, constraints))
+
+    def test_delta_scoring_matches_fitness_function(self):
+        constraints = {'region': {'diversity': 3}, 'player': ['player03']}
+        rng = random.Random(3)
+        pools = generate.build_candidate_pools(self.players)
+        for _ in range(20):
+            parent = generate.create_random_team(self.players, constraints, pools)
+            parent_evaluation = generate.evaluate_team(parent, constraints)
+            self.assertAlmostEqual(parent_evaluation['fitness'], generate.fitness_function(parent, constraints))
+            child = list(parent)
+            for slot in rng.sample(range(5), 2):
+                role = child[slot]['assigned_role']
+                replacement = generate.pick_random_candidate(pools, role, {p['player_id'] for p in child})
+                child[slot] = dict(replacement, assigned_role=role)
+            evaluation = generate.evaluate_child(child, parent, parent_evaluation, constraints, {})
+            self.assertAlmostEqual(evaluation['fitness'], generate.fitness_function(child, constraints))
+
+    def test_upsert_matches_full_renormalization(self):
+        updates = [dict(self.raw_players[5], acs=400.0),  # A new maximum rescales acs
+                   dict(self.raw_players[6], kd_ratio=1.0),
+                   dict(synthetic_player(random.Random(11), 99), roles=['Duelist', 'Sentinel'])]
+        players = generate.load_player_data()
+        generate.upsert_players(players, json.loads(json.dumps(updates)))
+        upserted = {player['player_id']: player for player in players}
+        updated_rows = {update['player_id']: update for update in updates}
+        raw_players = [updated_rows.pop(player['player_id'], player) for player in self.raw_players]
+        expected = generate.load_player_data(write_roster(raw_players + list(updated_rows.values()), 'upserted.json'))
+        self.assertEqual(len(players), len(expected))
+        for player in expected:
+            for stat in generate.score_stats:
+                self.assertAlmostEqual(upserted[player['player_id']][stat], player[stat])
+            for role, score in player['role_scores'].items():
+                self.assertAlmostEqual(upserted[player['player_id']]['role_scores'][role], score)
+        generate.roster_cache.clear()  # load_player_data replaced the index of the cached roster
+
+    def test_suggest(self):
+        status, body = call({'suggest': 'VORTEX'})
+        self.assertEqual(status, 200)
+        self.assertEqual(body['suggestions'][0]['handle'], 'Vortex')
+        self.assertEqual(body['suggestions'][0]['match'], 'casefold')
+        self.assertEqual(call({'suggest': ''})[0], 400)
+
+    def test_similar(self):
+        status, body = call({'similar': 'player01', 'k': 3, 'exclude': ['player02']})
+        self.assertEqual(status, 200)
+        handles = [player['handle'] for player in body['similar']]
+        self.assertEqual(len(handles), 3)
+        self.assertNotIn('player01', handles)
+        self.assertNotIn('player02', handles)
+        distances = [player['distance'] for player in body['similar']]
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual(call({'similar': 'no-such-player'})[0], 400)
+
+    def test_evaluate(self):
+        lineup = ['player01', 'player02', 'player03', 'player04', 'player05']
+        status, body = call({'evaluate': [lineup, lineup[:4]], 'constraints': {'region': {'diversity': 2}}})
+        self.assertEqual(status, 200)
+        result, error = body['results']
+        self.assertIn('error', error)
+        index = generate.get_handle_index(self.players)
+        team = [dict(index['exact'][entry['handle']][0], assigned_role=entry['role']) for entry in result['assignment']]
+        if None not in [player['assigned_role'] for player in team]:
+            self.assertAlmostEqual(result['fitness'], generate.fitness_function(team, {'region': {'diversity': 2}}))
+
+    def test_constraint_validation(self):
+        for constraints in [{'league': 'vct-international'}, {'league': {'game-changers': {'min': 6}}},
+                            {'region': {'diversity': 6}}, {'player': 'Vortex'}, {'unknown': 1}]:
+            self.assertIsNotNone(generate.normalize_constraints(constraints)[1], constraints)
+            self.assertEqual(call({'constraints': constraints})[0], 400, constraints)
+        for constraints in [{'league': {'no-such-league': {'min': 1}}}, {'player': ['no-such-player']},
+                            {'league': {'vct-international': {'exact': 5}}, 'region': {'diversity': 5}}]:
+            self.assertEqual(call({'constraints': constraints})[0], 400, constraints)
+        self.assertEqual(generate.normalize_constraints({'region': {'diversity': 2}}), ({'region': {'diversity': 2}},
+                                                                                        None))
+        self.assertEqual(call({'constraints': {}, 'seed': 1.5})[0], 400)
+        self.assertEqual(call({'constraints': {}, 'k': 3, 'engine': 'exact'})[0], 400)
+
+
+def vlr_date(date):
+    # vlr.gg style date without a year, e.g. "Monday, July 8th"
+    suffix = 'th' if 10 <= date.day % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(date.day % 10, 'th')
+    return f"{date.strftime('%A, %B')} {date.day}{suffix}"
+
+
+def rated_players(matches):
+    # One player per team, each with the vlr.gg results of the matches their team played.
+    # matches: [(match id, date, team, opponent, team won)]
+    players = []
+    for index, name in enumerate(team_names):
+        results = [{'date': vlr_date(date), 'url': f'https://www.vlr.gg/{match_id}/match',
+                    'event': f'Champions Tour {date.year}', 'result': {team: int(won) + 1, opponent: int(not won) + 1}}
+                   for match_id, date, team, opponent, won in matches if name in (team, opponent)]
+        players.append({'player_id': str(index), 'handle': name.split()[0], 'recent_match_result': json.dumps(results),
+                        'past_teams': [{'team_name': name}]})
+    return players
+
+
+class BuildRatingsTest(unittest.TestCase):
+    def build(self, players, ratings=None):
+        with contextlib.redirect_stdout(io.StringIO()):  # Missing esports data is reported and skipped
+            return build_ratings.build_ratings(players, temp_dir, json.loads(json.dumps(ratings)) if ratings else None)
+
+    def matches(self):
+        rng = random.Random(5)
+        start = datetime.date(2024, 3, 1)
+        return [(100 + day, start + datetime.timedelta(days=day), *rng.sample(team_names, 2), rng.random() < 0.5)
+                for day in range(0, 40, 4)]
+
+    def test_incremental_build_matches_full_build(self):
+        matches = self.matches()
+        ratings, processed, rebuilt = self.build(rated_players(matches[:6]))
+        self.assertEqual((processed, rebuilt), (6, False))
+        ratings, processed, rebuilt = self.build(rated_players(matches), ratings)
+        self.assertEqual((processed, rebuilt), (4, False))
+        self.assertEqual(ratings, self.build(rated_players(matches))[0])
+
+    def test_same_day_match_is_incremental(self):
+        matches = self.matches()
+        ratings = self.build(rated_players(matches))[0]
+        last = matches[-1]
+        same_day = (999, last[1], last[3], last[2], not last[4])
+        self.assertEqual(self.build(rated_players(matches + [same_day]), ratings)[1:], (1, False))
+
+    def test_older_match_rebuilds(self):
+        matches = self.matches()
+        ratings = self.build(rated_players(matches[1:]))[0]
+        ratings, processed, rebuilt = self.build(rated_players(matches), ratings)
+        self.assertEqual((processed, rebuilt), (len(matches), True))
+        self.assertEqual(ratings, self.build(rated_players(matches))[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import bisect
+import datetime
+import json
+import os
+
+import result_cache
+
+# Stat cube written by "1.4. build-stat-cube.py": measures summed per player x map x agent x day
+stat_cube_file = os.environ.get('TEAM_STAT_CUBE',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stat_cube.json'))
+
+# Rounds of evidence a player's all-map stats count for when their map stats are blended in
+prior_rounds = 100
+
+# Rolling windows given to feature extraction, in days ending on the cube's last day; None is all time
+stat_windows = {'30d': 30, '90d': 90, '365d': 365, 'all': None}
+
+# Window compared with all time for a player's recent form
+form_window = '90d'
+
+loaded_cube = {'version': None, 'cube': None}
+
+
+def load_stat_cube(path=None):
+    # Re-read when the file changes; None when no cube has been built
+    path = path or stat_cube_file
+    try:
+        version = result_cache.data_version(path)
+    except OSError:
+        return None
+    if version != loaded_cube['version']:
+        with open(path, 'r', encoding='utf-8') as f:
+            cube = json.load(f)
+        index_stat_cube(cube)
+        loaded_cube['cube'] = cube
+        loaded_cube['version'] = version
+    return loaded_cube['cube']
+
+
+def add_values(totals, values):
+    return [total + value for total, value in zip(totals, values)]
+
+
+def index_stat_cube(cube):
+    # Per-player rollups over agents and days, by map and overall, so map slices need no cell scan
+    width = len(cube['measures'])
+    cube['map_totals'] = {}
+    cube['totals'] = {}
+    for player_id, cells in cube['players'].items():
+        by_map = {}
+        total = [0] * width
+        for cell in cells:
+            map_name = cube['maps'][cell[0]]
+            by_map[map_name] = add_values(by_map.get(map_name, [0] * width), cell[3:])
+            total = add_values(total, cell[3:])
+        cube['map_totals'][player_id] = by_map
+        cube['totals'][player_id] = total
+    cube['last_day'] = max(cube['days'], default=None)
+    cube['daily'] = {}
+
+
+def aggregate(cube, player_id, maps=None, agents=None, since=None, until=None):
+    # Summed measures of one player over a slice: map and agent names and an inclusive day range (YYYY-MM-DD);
+    # None leaves a dimension unrestricted
+    width = len(cube['measures'])
+    if agents is None and since is None and until is None:
+        by_map = cube['map_totals'].get(player_id, {})
+        totals = [0] * width
+        for map_name in (by_map if maps is None else maps):
+            totals = add_values(totals, by_map.get(map_name, [0] * width))
+        return dict(zip(cube['measures'], totals))
+    totals = [0] * width
+    for cell in cube['players'].get(player_id, []):
+        day = cube['days'][cell[2]]
+        if (maps is None or cube['maps'][cell[0]] in maps) and \
+                (agents is None or cube['agents'][cell[1]] in agents) and \
+                (since is None or day >= since) and (until is None or day <= until):
+            totals = add_values(totals, cell[3:])
+    return dict(zip(cube['measures'], totals))
+
+
+def derived_stats(totals):
+    # The generator's stats that game events determine, per round as in step4_feature_extraction; acs is
+    # approximated from damage, kills and assists
+    rounds = max(totals['rounds'], 1)
+    return {
+        'acs': (totals['damage'] + 150 * totals['kills'] + 25 * totals['assists']) / rounds,
+        'kd_ratio': totals['kills'] / max(totals['deaths'], 1),
+        'adr': totals['damage'] / rounds,
+        'assist_score': totals['assists'] / rounds,
+        'map_awareness': (totals['first_kills'] / rounds) / max(1, totals['first_deaths'] / rounds),
+    }
+
+
+def map_factors(cube, player_id, maps):
+    # How much better or worse a player does on the given maps than on all maps, per stat, shrunk towards 1 for
+    # players with few rounds on those maps; empty when the cube has no games of the player on them
+    overall = cube['totals'].get(player_id)
+    if overall is None:
+        return {}
+    on_maps = aggregate(cube, player_id, maps)
+    if not on_maps['rounds']:
+        return {}
+    weight = on_maps['rounds'] / (on_maps['rounds'] + prior_rounds)
+    overall_stats = derived_stats(dict(zip(cube['measures'], overall)))
+    map_stats = derived_stats(on_maps)
+    return {stat: 1 + weight * (value / overall_stats[stat] - 1)
+            for stat, value in map_stats.items() if overall_stats[stat] > 0}
+
+
+def player_days(cube, player_id):
+    # A player's daily buckets: the sorted days they played and the running totals of the measures through each
+    # day. Built on first use, so reloading a cube with new games only pays for the players queried again.
+    if player_id not in cube['daily']:
+        width = len(cube['measures'])
+        by_day = {}
+        for cell in cube['players'].get(player_id, []):
+            day = cube['days'][cell[2]]
+            by_day[day] = add_values(by_day.get(day, [0] * width), cell[3:])
+        days = sorted(by_day)
+        running = [0] * width
+        prefix = []
+        for day in days:
+            running = add_values(running, by_day[day])
+            prefix.append(running)
+        cube['daily'][player_id] = (days, prefix)
+    return cube['daily'][player_id]
+
+
+def window_totals(cube, player_id, days=None, end=None):
+    # Measures summed over the `days` days through end (YYYY-MM-DD, default the cube's last day), or over all days
+    # through end when days is None; two bisections on the running totals, whatever the window length
+    width = len(cube['measures'])
+    bucket_days, prefix = player_days(cube, player_id)
+    end = end or cube['last_day']
+    stop = bisect.bisect_right(bucket_days, end) if end else 0
+    totals = prefix[stop - 1] if stop else [0] * width
+    if days is not None and stop:
+        start = (datetime.date.fromisoformat(end) - datetime.timedelta(days=days - 1)).isoformat()
+        before = bisect.bisect_left(bucket_days, start)
+        if before:
+            totals = [total - earlier for total, earlier in zip(totals, prefix[before - 1])]
+    return dict(zip(cube['measures'], totals))
+
+
+def window_stats(cube, player_id, end=None):
+    # Derived stats of each rolling window, with the games and rounds behind them; windows without games are left
+    # out
+    windows = {}
+    for window, days in stat_windows.items():
+        totals = window_totals(cube, player_id, days, end)
+        if totals['rounds']:
+            windows[window] = dict(derived_stats(totals), games=totals['games'], rounds=totals['rounds'])
+    return windows
+
+
+def form_factors(cube):
+    # Every player's ACS over form_window relative to their all-time ACS, shrunk towards 1 like map_factors for
+    # players with few recent rounds; players without recent games are left out. Computed once per loaded cube.
+    if 'form' not in cube:
+        cube['form'] = {}
+        for player_id in cube['players']:
+            windows = window_stats(cube, player_id)
+            recent = windows.get(form_window)
+            if recent is None or not windows['all']['acs']:
+                continue
+            weight = recent['rounds'] / (recent['rounds'] + prior_rounds)
+            cube['form'][player_id] = 1 + weight * (recent['acs'] / windows['all']['acs'] - 1)
+    return cube['form']